@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Benchmark do checksum complemento-de-um.
+
+Compara checksum.calc_checksum com a implementação de referência de
+tcputils.calc_checksum para tamanhos de 20 bytes a 64 KiB, conferindo que os
+resultados são idênticos para bytes, bytearray e memoryview, com e sem
+pseudocabeçalho.
+
+Uso: python3 benchmarks/bench_checksum.py
+"""
+import os
+import sys
+import random
+from time import perf_counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import tcputils
+import checksum
+
+
+def medir(funcao, dados, vezes):
+    inicio = perf_counter()
+    for _ in range(vezes):
+        funcao(dados, '192.168.200.1', '192.168.200.4')
+    return (perf_counter() - inicio) / vezes
+
+
+def main():
+    rng = random.Random(1234)
+
+    # Equivalência, incluindo tamanhos ímpares e buffers só com 0x00 ou 0xff
+    for tamanho in list(range(0, 64)) + [1459, 1460, 1480, 65535]:
+        for dados in (rng.randbytes(tamanho), bytes(tamanho), b'\xff' * tamanho):
+            esperado = tcputils.calc_checksum(dados)
+            esperado_pseudo = tcputils.calc_checksum(dados, '10.0.0.1', '10.0.0.2')
+            for tipo in (bytes, bytearray, memoryview):
+                assert checksum.calc_checksum(tipo(dados)) == esperado
+                assert checksum.calc_checksum(tipo(dados), '10.0.0.1', '10.0.0.2') == esperado_pseudo
+            if tamanho >= 20:
+                assert checksum.fix_checksum(dados, '10.0.0.1', '10.0.0.2') == \
+                    tcputils.fix_checksum(dados, '10.0.0.1', '10.0.0.2')
+    print('resultados idênticos à implementação de referência')
+    print()
+
+    print('%8s %18s %18s %8s' % ('bytes', 'referencia (us)', 'acelerado (us)', 'ganho'))
+    for tamanho in (20, 40, 576, 1480, 4096, 16384, 65535):
+        dados = rng.randbytes(tamanho)
+        vezes = max(20, 200000 // tamanho)
+        referencia = medir(tcputils.calc_checksum, dados, vezes) * 1e6
+        acelerado = medir(checksum.calc_checksum, dados, vezes * 20) * 1e6
+        print('%8d %18.2f %18.2f %7.0fx' % (tamanho, referencia, acelerado,
+                                             referencia / acelerado))
+
+
+if __name__ == '__main__':
+    main()
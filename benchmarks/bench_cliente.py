@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Benchmark do lado ativo do TCP (tcp.Cliente) e do pool de conexões, na
+topologia simulada das placas (vide simulacao.py).
+
+O host, usando apenas a nossa pilha, faz requisições sequenciais ao servidor
+de eco da placa 3: envia um bloco e espera o eco completo. Compara abrir uma
+conexão nova para cada requisição com reaproveitar conexões de um
+PoolConexoes, medindo requisições por segundo e a latência de cada uma
+(incluindo o handshake, quando há).
+
+Uso: python3 benchmarks/bench_cliente.py [--baud 115200] [--latencia 0.001]
+         [--perda 0] [--requisicoes 50] [--tamanho 100]
+"""
+import os
+import sys
+import random
+import asyncio
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from simulacao import montar_topologia, PORTA_ECO
+from tcp import Cliente, PoolConexoes
+
+
+async def requisicao(conexao, dados):
+    """ Envia dados pela conexão e espera o eco completo. """
+    recebido = bytearray()
+    completo = asyncio.Event()
+
+    def dados_recebidos(conexao, dados_novos):
+        recebido.extend(dados_novos)
+        if len(recebido) >= len(dados):
+            completo.set()
+
+    conexao.registrar_recebedor(dados_recebidos)
+    conexao.enviar(dados)
+    await completo.wait()
+    assert bytes(recebido) == dados
+
+
+async def medir(args, usar_pool):
+    rng = random.Random(1234)
+    rede = montar_topologia(baud=args.baud, latencia=args.latencia, perda=args.perda, rng=rng)
+    cliente = Cliente(rede.host)
+    pool = PoolConexoes(cliente)
+    loop = asyncio.get_running_loop()
+
+    latencias = []
+    inicio = loop.time()
+    for _ in range(args.requisicoes):
+        t = loop.time()
+        if usar_pool:
+            conexao = await pool.obter('192.168.200.4', PORTA_ECO)
+        else:
+            conexao = await cliente.conectar('192.168.200.4', PORTA_ECO)
+        await requisicao(conexao, rng.randbytes(args.tamanho))
+        if usar_pool:
+            pool.devolver(conexao)
+        latencias.append(loop.time() - t)
+    duracao = loop.time() - inicio
+
+    for conexao in cliente.conexoes.values():
+        conexao._parar_timer()
+    for conexao in rede.servidor.conexoes.values():
+        conexao._parar_timer()
+    return args.requisicoes / duracao, statistics.median(latencias), len(cliente.conexoes)
+
+
+async def main(args):
+    print('%24s %14s %22s %10s' % ('', 'requisições/s', 'latência mediana (ms)', 'conexões'))
+    for usar_pool, nome in ((False, 'conexão por requisição'), (True, 'pool de conexões')):
+        taxa, latencia, conexoes = await medir(args, usar_pool)
+        print('%24s %14.1f %22.1f %10d' % (nome, taxa, latencia * 1e3, conexoes))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--baud', type=int, default=115200,
+                        help='taxa das linhas seriais (0 = instantânea)')
+    parser.add_argument('--latencia', type=float, default=0.001,
+                        help='latência de cada linha, em segundos')
+    parser.add_argument('--perda', type=float, default=0,
+                        help='probabilidade de perder cada envio')
+    parser.add_argument('--requisicoes', type=int, default=50,
+                        help='quantidade de requisições')
+    parser.add_argument('--tamanho', type=int, default=100,
+                        help='tamanho de cada requisição, em bytes')
+    asyncio.run(main(parser.parse_args()))
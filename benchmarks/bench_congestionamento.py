@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Benchmark dos algoritmos de controle de congestionamento (Reno e CUBIC) na
+topologia simulada das placas (vide simulacao.py), com vários produtos
+banda-atraso.
+
+Um servidor na placa 3 envia os dados assim que aceita a conexão, e um
+cliente receptor no host confirma cada segmento recebido anunciando a maior
+janela possível, de forma que a vazão fica limitada pela cwnd do servidor.
+Como as perdas são aleatórias, cada medida é a média de algumas sementes.
+
+Uso: python3 benchmarks/bench_congestionamento.py [--perda 0.01]
+         [--bytes 300000] [--sementes 3]
+"""
+import os
+import sys
+import random
+import asyncio
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from bench_perdas import ClienteReceptor, PORTA_DESCARTE
+from checksum import fix_checksum
+from congestionamento import Reno, Cubic
+from simulacao import montar_topologia
+from tcp import Servidor, montar_cabecalho
+
+# (baud, latência de cada linha em segundos); baud 0 = linha instantânea
+LINHAS = [
+    (1000000, 0.001),
+    (1000000, 0.01),
+    (1000000, 0.03),
+    (0, 0.01),
+    (0, 0.03),
+]
+
+
+class ClienteJanelaMaxima(ClienteReceptor):
+    """
+    ClienteReceptor que anuncia janela de 64 KiB em vez da janela fixa do
+    make_header.
+    """
+    def _enviar(self, seq_no, flags, payload=b''):
+        segmento = montar_cabecalho(self.src_port, self.dst_port, seq_no,
+                                    self.ack_no or 0, flags, 0xffff) + payload
+        self.rede.enviar(fix_checksum(segmento, self.src_addr, self.dst_addr),
+                         self.dst_addr)
+
+
+async def medir(args, baud, latencia, algoritmo, semente):
+    rng = random.Random(semente)
+    rede = montar_topologia(baud=baud, latencia=latencia, perda=args.perda, rng=rng)
+    dados = rng.randbytes(args.bytes)
+    servidor = Servidor(rede.placa3, PORTA_DESCARTE, algoritmo)
+    servidor.registrar_monitor_de_conexoes_aceitas(lambda conexao: conexao.enviar(dados))
+    cliente = ClienteJanelaMaxima(rede.host, '192.168.200.4', PORTA_DESCARTE, args.bytes)
+
+    loop = asyncio.get_running_loop()
+    inicio = loop.time()
+    await cliente.conectar()
+    await cliente.concluido.wait()
+    duracao = loop.time() - inicio
+    for conexao in servidor.conexoes.values():
+        conexao._parar_timer()
+    return args.bytes / duracao
+
+
+async def main(args):
+    print('%8s %10s %14s %14s' % ('baud', 'rtt (ms)', 'Reno (B/s)', 'CUBIC (B/s)'))
+    for baud, latencia in LINHAS:
+        # Ida e volta passam pelas três linhas
+        rtt = 6 * latencia
+        resultados = []
+        for algoritmo in (Reno, Cubic):
+            vazoes = [await medir(args, baud or None, latencia, algoritmo, semente)
+                      for semente in range(args.sementes)]
+            resultados.append(sum(vazoes) / len(vazoes))
+        print('%8s %10.0f %14.0f %14.0f' % (baud or '-', rtt * 1000, *resultados))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--perda', type=float, default=0.01,
+                        help='probabilidade de perda em cada linha')
+    parser.add_argument('--bytes', type=int, default=300000,
+                        help='quantidade de dados a enviar')
+    parser.add_argument('--sementes', type=int, default=3,
+                        help='quantidade de sementes aleatórias por medida')
+    asyncio.run(main(parser.parse_args()))
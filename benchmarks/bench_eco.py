@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Benchmark ponta a ponta do servidor de eco na topologia simulada das placas
+(vide simulacao.py), sem precisar do hardware.
+
+O nó host abre uma conexão com o servidor de eco da placa 3 e envia blocos de
+até um MSS (ou do tamanho dado por --bloco), esperando o eco completo de cada um antes de enviar o próximo.
+Mede a vazão de eco, a latência de cada bloco e a utilização das linhas
+seriais (bytes transmitidos nelas, em todos os saltos e nos dois sentidos,
+por byte ecoado), com a Conexao confirmando cada segmento na hora e com ACKs
+atrasados, que vão junto com o eco. Como o tcp.py só implementa o lado
+passivo, o cliente usado aqui é um TCP mínimo (para e espera, com
+retransmissão por timeout fixo).
+
+Uso: python3 benchmarks/bench_eco.py [--baud 115200] [--latencia 0.001]
+         [--perda 0] [--corrupcao 0] [--bytes 16384] [--bloco 1460]
+"""
+import os
+import sys
+import random
+import asyncio
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from tcputils import FLAGS_ACK, FLAGS_SYN, MSS, make_header, read_header
+from checksum import fix_checksum
+from simulacao import montar_topologia, PORTA_ECO
+from tcp import Conexao
+
+
+class ClienteMinimo:
+    """ Cliente TCP mínimo, suficiente para exercitar o servidor de eco. """
+    def __init__(self, rede, dst_addr, dst_port, timeout=1.0):
+        self.rede = rede
+        self.src_addr = rede.meu_endereco
+        self.src_port = random.randint(1024, 65535)
+        self.dst_addr = dst_addr
+        self.dst_port = dst_port
+        self.timeout = timeout
+        self.seq_no = random.randint(0, 0xffff)
+        self.ack_no = None
+        self.recebido = bytearray()
+        self.evento = asyncio.Event()
+        self.retransmissoes = 0
+        rede.registrar_recebedor(self._rdt_rcv)
+
+    def _enviar(self, seq_no, flags, payload=b''):
+        segmento = make_header(self.src_port, self.dst_port, seq_no,
+                               self.ack_no or 0, flags) + payload
+        self.rede.enviar(fix_checksum(segmento, self.src_addr, self.dst_addr),
+                         self.dst_addr)
+
+    def _rdt_rcv(self, src_addr, dst_addr, segment):
+        src_port, dst_port, seq_no, ack_no, flags, _, _, _ = read_header(segment)
+        if dst_port != self.src_port:
+            return
+        payload = segment[4*(flags >> 12):]
+        if flags & FLAGS_SYN:
+            self.ack_no = (seq_no + 1) & 0xffffffff
+            self.evento.set()
+        elif payload and seq_no == self.ack_no:
+            self.ack_no = (self.ack_no + len(payload)) & 0xffffffff
+            self.recebido += payload
+            self.evento.set()
+        if (flags & FLAGS_SYN) or payload:
+            self._enviar(self.seq_no, FLAGS_ACK)
+
+    async def _esperar(self, condicao, transmitir):
+        """
+        Transmite e espera até que a condição seja satisfeita, transmitindo de
+        novo a cada timeout sem progresso.
+        """
+        transmitir()
+        while not condicao():
+            self.evento.clear()
+            try:
+                await asyncio.wait_for(self.evento.wait(), self.timeout)
+            except asyncio.TimeoutError:
+                self.retransmissoes += 1
+                transmitir()
+
+    async def conectar(self):
+        await self._esperar(lambda: self.ack_no is not None,
+                            lambda: self._enviar(self.seq_no, FLAGS_SYN))
+        self.seq_no += 1
+
+    async def eco(self, bloco):
+        esperado = len(self.recebido) + len(bloco)
+        seq_no = self.seq_no
+        self.seq_no += len(bloco)
+        await self._esperar(lambda: len(self.recebido) >= esperado,
+                            lambda: self._enviar(seq_no, FLAGS_ACK, bloco))
+
+
+async def medir(args, atrasar_acks):
+    Conexao.atrasar_acks = atrasar_acks
+    rng = random.Random(1234)
+    rede = montar_topologia(baud=args.baud, latencia=args.latencia, perda=args.perda,
+                            corrupcao=args.corrupcao, rng=rng)
+    cliente = ClienteMinimo(rede.host, '192.168.200.4', PORTA_ECO)
+    loop = asyncio.get_running_loop()
+
+    inicio = loop.time()
+    await cliente.conectar()
+    print('conexão estabelecida em %.1f ms' % ((loop.time() - inicio) * 1e3))
+
+    dados = rng.randbytes(args.bytes)
+    latencias = []
+    inicio = loop.time()
+    for i in range(0, len(dados), args.bloco):
+        t = loop.time()
+        await cliente.eco(dados[i:i + args.bloco])
+        latencias.append(loop.time() - t)
+    duracao = loop.time() - inicio
+    assert bytes(cliente.recebido) == dados
+
+    print('%d bytes ecoados em %.2f s: %.0f B/s' % (len(dados), duracao, len(dados) / duracao))
+    print('latência por bloco de %d bytes: mediana %.1f ms, máxima %.1f ms' %
+          (args.bloco, statistics.median(latencias) * 1e3, max(latencias) * 1e3))
+    print('retransmissões do cliente: %d; envios perdidos: %d; corrompidos: %d' %
+          (cliente.retransmissoes, sum(l.envios_perdidos for l in rede.linhas),
+           sum(l.envios_corrompidos for l in rede.linhas)))
+    bytes_linhas = sum(l.bytes_enviados for l in rede.linhas)
+    print('bytes nas linhas: %d (%.3f por byte ecoado)' %
+          (bytes_linhas, bytes_linhas / len(dados)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--baud', type=int, default=115200,
+                        help='taxa das linhas seriais (0 = instantânea)')
+    parser.add_argument('--latencia', type=float, default=0.001,
+                        help='latência de cada linha, em segundos')
+    parser.add_argument('--perda', type=float, default=0,
+                        help='probabilidade de perder cada envio')
+    parser.add_argument('--corrupcao', type=float, default=0,
+                        help='probabilidade de corromper cada envio')
+    parser.add_argument('--bytes', type=int, default=16384,
+                        help='quantidade de dados a ecoar')
+    parser.add_argument('--bloco', type=int, default=MSS,
+                        help='tamanho de cada bloco ecoado (no máximo um MSS)')
+    args = parser.parse_args()
+    for atrasar_acks in (False, True):
+        print('ACKs %s:' % ('atrasados' if atrasar_acks else 'imediatos'))
+        asyncio.run(medir(args, atrasar_acks))
+        print()
+
+
+if __name__ == '__main__':
+    main()
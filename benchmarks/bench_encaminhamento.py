@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark da busca de prefixo mais longo (IP._next_hop).
+
+Mede buscas por segundo para tabelas de 10 a 100k rotas, comparando a
+implementação compilada com a varredura linear original (esta só é medida
+nas tabelas menores, pois fica lenta demais nas maiores). Em seguida mede o
+efeito do cache de rotas com tráfego concentrado em poucos destinos e o custo
+de alterar rotas (adicionar_rota/remover_rota) em tabelas grandes, comparado
+a reinstalar a tabela inteira com definir_tabela_encaminhamento.
+
+Uso: python3 benchmarks/bench_encaminhamento.py
+"""
+import os
+import sys
+import random
+from time import perf_counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from ip import IP
+
+
+class EnlaceNulo:
+    ignore_checksum = False
+
+    def registrar_recebedor(self, callback):
+        pass
+
+    def enviar(self, datagrama, next_hop):
+        pass
+
+
+def next_hop_linear(tabela, dest_addr):
+    """ Implementação original, baseada em strings de bits. """
+    dest_addr_bits = ''.join(f'{int(octeto):08b}' for octeto in dest_addr.split('.'))
+    best_match = None
+    max_prefix_length = -1
+    for cidr, next_hop in tabela:
+        rede, prefixo = cidr.split('/')
+        prefixo = int(prefixo)
+        rede_bits = ''.join(f'{int(octeto):08b}' for octeto in rede.split('.'))
+        if rede_bits[:prefixo] == dest_addr_bits[:prefixo]:
+            if prefixo > max_prefix_length:
+                max_prefix_length = prefixo
+                best_match = next_hop
+    return best_match
+
+
+def int2str(x):
+    return '%d.%d.%d.%d' % (x >> 24, (x >> 16) & 0xff, (x >> 8) & 0xff, x & 0xff)
+
+
+def gerar_tabela(rng, n):
+    tabela = [('0.0.0.0/0', '10.0.0.1')]
+    for _ in range(n - 1):
+        prefixo = rng.randint(8, 32)
+        rede = rng.getrandbits(32) & ((0xffffffff << (32 - prefixo)) & 0xffffffff)
+        tabela.append(('%s/%d' % (int2str(rede), prefixo),
+                       '10.0.%d.%d' % (rng.randint(0, 255), rng.randint(1, 254))))
+    return tabela
+
+
+def gerar_destinos(rng, tabela, n):
+    # Metade dos destinos cai dentro de alguma rota específica da tabela,
+    # a outra metade é aleatória (em geral casa só com a rota padrão).
+    destinos = []
+    for i in range(n):
+        if i % 2 == 0:
+            rede, prefixo = rng.choice(tabela)[0].split('/')
+            base = int.from_bytes(bytes(int(x) for x in rede.split('.')), 'big')
+            host = rng.getrandbits(32 - int(prefixo)) if int(prefixo) < 32 else 0
+            destinos.append(int2str(base | host))
+        else:
+            destinos.append(int2str(rng.getrandbits(32)))
+    return destinos
+
+
+def medir(funcao, destinos):
+    inicio = perf_counter()
+    for dest in destinos:
+        funcao(dest)
+    return len(destinos) / (perf_counter() - inicio)
+
+
+def main():
+    rng = random.Random(1234)
+    print('%8s %16s %16s' % ('rotas', 'compilada (/s)', 'linear (/s)'))
+    for n in (10, 100, 1000, 10000, 100000):
+        tabela = gerar_tabela(rng, n)
+        destinos = gerar_destinos(rng, tabela, 20000)
+
+        rede = IP(EnlaceNulo(), tamanho_cache_rotas=0)
+        rede.definir_tabela_encaminhamento(tabela)
+        compilada = medir(rede._next_hop, destinos)
+
+        linear = '-'
+        if n <= 1000:
+            amostra = destinos[:max(200, 20000 // n)]
+            for dest in amostra:
+                assert rede._next_hop(dest) == next_hop_linear(tabela, dest), dest
+            linear = '%.0f' % medir(lambda dest: next_hop_linear(tabela, dest), amostra)
+
+        print('%8d %16.0f %16s' % (n, compilada, linear))
+
+    # Tráfego concentrado: 90% dos pacotes vão para 100 destinos "quentes"
+    tabela = gerar_tabela(rng, 100000)
+    quentes = gerar_destinos(rng, tabela, 100)
+    frios = gerar_destinos(rng, tabela, 20000)
+    destinos = [rng.choice(quentes) if rng.random() < 0.9 else rng.choice(frios)
+                for _ in range(100000)]
+    print()
+    print('tabela com 100000 rotas, 90% do tráfego para 100 destinos')
+    print('%8s %16s %10s %10s %10s' % ('cache', 'buscas/s', 'acertos', 'falhas', 'remocoes'))
+    for tamanho in (0, 64, 256, 1024, 4096):
+        rede = IP(EnlaceNulo(), tamanho_cache_rotas=tamanho)
+        rede.definir_tabela_encaminhamento(tabela)
+        taxa = medir(rede._next_hop, destinos)
+        est = rede.estatisticas_cache_rotas()
+        print('%8d %16.0f %10d %10d %10d' % (tamanho, taxa, est['acertos'],
+                                             est['falhas'], est['remocoes']))
+
+    # Churn: cada alteração adiciona uma rota nova e remove uma antiga,
+    # enquanto o cache continua em uso por buscas intercaladas.
+    print()
+    print('%8s %22s %22s' % ('rotas', 'incremental (us/alt)', 'reinstalar (ms/alt)'))
+    for n in (1000, 10000, 100000):
+        tabela = gerar_tabela(rng, n)
+        novas = gerar_tabela(rng, 2001)[1:]
+        destinos = gerar_destinos(rng, tabela, 2000)
+        rede = IP(EnlaceNulo())
+        rede.definir_tabela_encaminhamento(tabela)
+        alteracoes = list(zip(novas, tabela[1:], destinos))
+        inicio = perf_counter()
+        for (cidr, next_hop), (antigo, _), dest in alteracoes:
+            rede.adicionar_rota(cidr, next_hop)
+            rede.remover_rota(antigo)
+            rede._next_hop(dest)
+        incremental = (perf_counter() - inicio) / len(alteracoes) * 1e6
+
+        vezes = 5
+        inicio = perf_counter()
+        for i in range(vezes):
+            tabela[i + 1] = novas[i]
+            rede.definir_tabela_encaminhamento(tabela)
+        reinstalar = (perf_counter() - inicio) / vezes * 1e3
+        print('%8d %22.2f %22.2f' % (n, incremental, reinstalar))
+
+
+if __name__ == '__main__':
+    main()
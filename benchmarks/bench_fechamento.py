@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Teste de resistência do fechamento de conexões: abre e fecha 100k conexões
+entre um tcp.Cliente e um tcp.Servidor de eco e confere que a memória não
+cresce com a quantidade de conexões já encerradas.
+
+Os dois nós são ligados por uma camada de rede em memória (RedeMemoria), que
+entrega cada segmento à outra ponta na iteração seguinte do laço de eventos.
+Cada conexão faz uma requisição ao eco e é fechada pelo cliente, passando por
+FIN_WAIT_1, FIN_WAIT_2 e TIME_WAIT de um lado e CLOSE_WAIT e LAST_ACK do
+outro. A cada 10% das conexões, o benchmark mostra a memória alocada (via
+tracemalloc), as conexões ainda abertas em cada lado, o tamanho das tabelas
+de TIME_WAIT e os handles no heap do laço de eventos; ao final, confere que
+nenhuma conexão ficou aberta e que a memória ficou estável depois que a
+tabela de TIME_WAIT do cliente encheu.
+
+Uso: python3 benchmarks/bench_fechamento.py [--conexoes 100000]
+         [--simultaneas 64]
+"""
+import os
+import sys
+import gc
+import asyncio
+import argparse
+import tracemalloc
+from time import perf_counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from simulacao import conexao_aceita, PORTA_ECO
+from tcp import Cliente, Servidor
+
+CLIENTE_ADDR, SERVIDOR_ADDR = '10.0.0.1', '10.0.0.2'
+
+
+class RedeMemoria:
+    """
+    Camada de rede de um nó, ligada diretamente à de outro nó (atributo
+    outra), com o mesmo registro de recebedores por porta da camada IP.
+    """
+    ignore_checksum = True
+
+    def __init__(self, meu_endereco):
+        self.meu_endereco = meu_endereco
+        self.outra = None
+        self.recebedores = {}
+
+    def registrar_porta(self, proto, porta, callback):
+        if self.recebedores.get(porta, callback) != callback:
+            raise OSError('porta %d já está em uso' % porta)
+        self.recebedores[porta] = callback
+
+    def porta_registrada(self, proto, porta):
+        return porta in self.recebedores
+
+    def remover_porta(self, proto, porta, callback=None):
+        if callback is None or self.recebedores.get(porta) == callback:
+            self.recebedores.pop(porta, None)
+
+    def enviar(self, segmento, dest_addr):
+        asyncio.get_event_loop().call_soon(self.outra._receber, self.meu_endereco,
+                                           dest_addr, segmento)
+
+    def _receber(self, src_addr, dst_addr, segmento):
+        callback = self.recebedores.get(int.from_bytes(segmento[2:4], 'big'))
+        if callback:
+            callback(src_addr, dst_addr, segmento)
+
+
+async def ciclo(cliente, dados):
+    """ Abre uma conexão, espera o eco de dados e a fecha. """
+    conexao = await cliente.conectar(SERVIDOR_ADDR, PORTA_ECO)
+    recebido = bytearray()
+    completo = asyncio.Event()
+
+    def dados_recebidos(conexao, dados_novos):
+        recebido.extend(dados_novos)
+        if len(recebido) >= len(dados):
+            completo.set()
+
+    conexao.registrar_recebedor(dados_recebidos)
+    conexao.enviar(dados)
+    await completo.wait()
+    conexao.fechar()
+
+
+async def main(args):
+    rede_cliente, rede_servidor = RedeMemoria(CLIENTE_ADDR), RedeMemoria(SERVIDOR_ADDR)
+    rede_cliente.outra, rede_servidor.outra = rede_servidor, rede_cliente
+    servidor = Servidor(rede_servidor, PORTA_ECO)
+    servidor.registrar_monitor_de_conexoes_aceitas(conexao_aceita)
+    cliente = Cliente(rede_cliente)
+    loop = asyncio.get_running_loop()
+    dados = bytes(100)
+
+    intervalo = max(1, args.conexoes // 10)
+    feitas = 0
+    medidas = []
+
+    async def trabalhador(quantidade):
+        nonlocal feitas
+        for _ in range(quantidade):
+            await ciclo(cliente, dados)
+            feitas += 1
+
+    async def esvaziar():
+        # Espera os últimos segmentos do fechamento
+        while servidor.conexoes or cliente.conexoes:
+            await asyncio.sleep(0)
+
+    print('%10s %12s %10s %10s %10s %10s %8s' % ('conexões', 'memória (KiB)', 'abertas C',
+                                                 'abertas S', 'TIME_WAIT', 'portas', 'heap'))
+    tracemalloc.start()
+    inicio = perf_counter()
+    while feitas < args.conexoes:
+        lote = min(intervalo, args.conexoes - feitas)
+        por_trabalhador = [lote // args.simultaneas + (i < lote % args.simultaneas)
+                           for i in range(args.simultaneas)]
+        await asyncio.gather(*(trabalhador(n) for n in por_trabalhador if n))
+        await esvaziar()
+        # Não conta ciclos de objetos já descartados que o coletor ainda
+        # não liberou
+        gc.collect()
+        memoria = tracemalloc.get_traced_memory()[0]
+        if len(cliente.time_wait) == cliente.time_wait.maximo:
+            medidas.append((feitas, memoria))
+        print('%10d %12.0f %10d %10d %10d %10d %8d' % (
+            feitas, memoria / 1024, len(cliente.conexoes), len(servidor.conexoes),
+            len(cliente.time_wait), len(cliente.portas), len(loop._scheduled)))
+    duracao = perf_counter() - inicio
+    tracemalloc.stop()
+
+    print('\n%.0f conexões/s; TIME_WAIT descartadas antes do prazo: %d' % (
+        args.conexoes / duracao, cliente.time_wait.descartadas))
+    assert not cliente.conexoes and not servidor.conexoes, 'conexões não foram removidas'
+    assert len(servidor.time_wait) == 0
+    assert len(cliente.time_wait) <= cliente.time_wait.maximo
+    # Depois que a tabela de TIME_WAIT do cliente enche, a memória ainda
+    # varia um pouco enquanto dicionários e filas internos atingem a
+    # capacidade de regime, mas não deve crescer com a quantidade de
+    # conexões encerradas: compara o final com a metade das medidas
+    if len(medidas) > 1:
+        base = medidas[len(medidas) // 2 - 1]
+        crescimento = medidas[-1][1] - base[1]
+        print('crescimento entre %d e %d conexões: %.0f KiB (%.1f B/conexão)' % (
+            base[0], medidas[-1][0], crescimento / 1024,
+            crescimento / (medidas[-1][0] - base[0])))
+        assert crescimento < 1024 * 1024, 'memória cresceu'
+    print('memória estável')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--conexoes', type=int, default=100000,
+                        help='quantidade de conexões abertas e fechadas')
+    parser.add_argument('--simultaneas', type=int, default=64,
+                        help='quantidade de conexões em andamento ao mesmo tempo')
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Benchmark do custo das métricas (vide metricas.py) na pilha completa.
+
+Na topologia simulada das placas (vide simulacao.py), com linhas
+instantâneas para que o tempo medido seja só o de processamento, o host abre
+uma conexão com o tcp.Cliente e envia dados ao servidor de eco da placa 3,
+esperando o eco completo. Compara a vazão com o registro de métricas
+desativado (só os contadores) e ativado (contadores e histogramas) e, ao
+final, mostra o instantâneo das métricas de todas as camadas da execução
+com o registro ativo.
+
+Uso: python3 benchmarks/bench_metricas.py [--bytes 1000000] [--bloco 4096]
+         [--repeticoes 3]
+"""
+import os
+import sys
+import asyncio
+import argparse
+from time import perf_counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from metricas import registro
+from simulacao import montar_topologia, PORTA_ECO
+from tcp import Cliente
+
+
+async def medir(args, ativo):
+    rede = montar_topologia(baud=None, latencia=0)
+    cliente = Cliente(rede.host)
+    for nome in ('host', 'placa1', 'placa2', 'placa3'):
+        ip = getattr(rede, nome)
+        registro.registrar(nome + '.ip', ip)
+        registro.registrar(nome + '.slip', ip.enlace)
+    registro.registrar('host.tcp', cliente)
+    registro.registrar('placa3.tcp', rede.servidor)
+    registro.zerar_histogramas()
+    registro.ativo = ativo
+
+    dados = os.urandom(args.bytes)
+    recebido = bytearray()
+    completo = asyncio.Event()
+
+    def dados_recebidos(conexao, dados_novos):
+        recebido.extend(dados_novos)
+        if len(recebido) >= len(dados):
+            completo.set()
+
+    inicio = perf_counter()
+    conexao = await cliente.conectar('192.168.200.4', PORTA_ECO)
+    conexao.registrar_recebedor(dados_recebidos)
+    for i in range(0, len(dados), args.bloco):
+        conexao.enviar(dados[i:i + args.bloco])
+    await completo.wait()
+    duracao = perf_counter() - inicio
+    assert bytes(recebido) == dados
+
+    registro.ativo = False
+    conexao._parar_timer()
+    for conexao in rede.servidor.conexoes.values():
+        conexao._parar_timer()
+    return args.bytes / duracao, registro.instantaneo()
+
+
+async def main(args):
+    print('%12s %14s' % ('métricas', 'vazão (B/s)'))
+    for ativo, nome in ((False, 'desativadas'), (True, 'ativadas')):
+        taxas = []
+        for _ in range(args.repeticoes):
+            taxa, instantaneo = await medir(args, ativo)
+            taxas.append(taxa)
+        print('%12s %14.0f' % (nome, max(taxas)))
+
+    print('\nInstantâneo das métricas (última execução):')
+    for nome, valor in sorted(instantaneo.items()):
+        if isinstance(valor, float):
+            valor = '%.6g' % valor
+        print('  %s %s' % (nome, valor))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--bytes', type=int, default=1000000,
+                        help='quantidade de dados ecoados')
+    parser.add_argument('--bloco', type=int, default=4096,
+                        help='tamanho de cada chamada a Conexao.enviar')
+    parser.add_argument('--repeticoes', type=int, default=3,
+                        help='execuções de cada configuração (vale a melhor)')
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+Benchmark de goodput em função da taxa de perda, na topologia simulada das
+placas (vide simulacao.py).
+
+O nó host envia dados para um servidor de descarte (que apenas consome o que
+recebe) na placa 3, usando um cliente TCP mínimo com janela fixa que, a cada
+timeout ou a cada três ACKs duplicados, retransmite apenas o primeiro segmento
+não confirmado. Compara a Conexao do servidor guardando segmentos fora de
+ordem para remontagem com ela descartando-os, como fazia originalmente.
+
+Em seguida mede o sentido inverso: um servidor na placa 3 envia os dados
+assim que aceita a conexão, e um cliente receptor no host confirma cada
+segmento recebido (gerando ACKs duplicados quando há buracos). Compara a
+Conexao recuperando perdas apenas por timeout com ela fazendo retransmissão
+rápida após três ACKs duplicados, contando as retransmissões feitas pelo
+servidor e quantas delas se mostraram desnecessárias (esp.).
+
+Uso: python3 benchmarks/bench_perdas.py [--baud 0] [--latencia 0.002]
+         [--bytes 200000] [--janela 8]
+"""
+import os
+import sys
+import random
+import asyncio
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from tcputils import FLAGS_ACK, FLAGS_SYN, MSS, make_header, read_header
+from checksum import fix_checksum
+from simulacao import montar_topologia
+from tcp import Servidor, Conexao, _desdobrar
+
+PORTA_DESCARTE = 9
+
+
+class ClienteJanela:
+    """
+    Cliente TCP mínimo que só envia dados, com janela fixa de segmentos.
+    """
+    def __init__(self, rede, dst_addr, dst_port, janela, timeout=0.2):
+        self.rede = rede
+        self.src_addr = rede.meu_endereco
+        self.src_port = random.randint(1024, 65535)
+        self.dst_addr = dst_addr
+        self.dst_port = dst_port
+        self.janela = janela
+        self.timeout = timeout
+        self.seq_inicial = random.randint(0, 0xffff)
+        self.ack_no = None      # próximo byte esperado do servidor
+        self.confirmado = None  # maior ACK recebido do servidor
+        self.duplicados = 0
+        self.retransmissoes = 0
+        self.evento = asyncio.Event()
+        rede.registrar_recebedor(self._rdt_rcv)
+
+    def _enviar(self, seq_no, flags, payload=b''):
+        segmento = make_header(self.src_port, self.dst_port, seq_no,
+                               (self.ack_no or 0) & 0xffffffff, flags) + payload
+        self.rede.enviar(fix_checksum(segmento, self.src_addr, self.dst_addr),
+                         self.dst_addr)
+
+    def _rdt_rcv(self, src_addr, dst_addr, segment):
+        src_port, dst_port, seq_no, ack_no, flags, _, _, _ = read_header(segment)
+        if dst_port != self.src_port:
+            return
+        if flags & FLAGS_SYN:
+            self.ack_no = seq_no + 1
+            self.confirmado = ack_no
+        elif ack_no > self.confirmado:
+            self.confirmado = ack_no
+            self.duplicados = 0
+        else:
+            self.duplicados += 1
+        self.evento.set()
+
+    async def conectar(self):
+        while self.ack_no is None:
+            self._enviar(self.seq_inicial, FLAGS_SYN)
+            self.evento.clear()
+            try:
+                await asyncio.wait_for(self.evento.wait(), self.timeout)
+            except asyncio.TimeoutError:
+                pass
+        self._enviar(self.seq_inicial + 1, FLAGS_ACK)
+
+    def _segmento(self, dados, seq_no):
+        i = seq_no - self.seq_inicial - 1
+        return dados[i:i + MSS]
+
+    async def enviar(self, dados):
+        inicio = self.seq_inicial + 1
+        fim = inicio + len(dados)
+        proximo = inicio
+        while self.confirmado < fim:
+            # Transmite o que couber na janela
+            while proximo < fim and proximo < self.confirmado + self.janela * MSS:
+                payload = self._segmento(dados, proximo)
+                self._enviar(proximo, FLAGS_ACK, payload)
+                proximo += len(payload)
+            self.evento.clear()
+            try:
+                await asyncio.wait_for(self.evento.wait(), self.timeout)
+                if self.duplicados == 3:
+                    self.retransmissoes += 1
+                    self._enviar(self.confirmado, FLAGS_ACK,
+                                 self._segmento(dados, self.confirmado))
+            except asyncio.TimeoutError:
+                self.retransmissoes += 1
+                self._enviar(self.confirmado, FLAGS_ACK,
+                             self._segmento(dados, self.confirmado))
+
+
+class ClienteReceptor(ClienteJanela):
+    """
+    Cliente TCP mínimo que só recebe dados. Guarda segmentos fora de ordem e
+    responde a todo segmento com um ACK cumulativo, como um receptor comum.
+    """
+    def __init__(self, rede, dst_addr, dst_port, total):
+        super().__init__(rede, dst_addr, dst_port, janela=0)
+        self.total = total
+        self.recebidos = 0
+        self.fora_de_ordem = {}
+        self.concluido = asyncio.Event()
+
+    def _rdt_rcv(self, src_addr, dst_addr, segment):
+        src_port, dst_port, seq_no, ack_no, flags, _, _, _ = read_header(segment)
+        if dst_port != self.src_port:
+            return
+        if flags & FLAGS_SYN:
+            self.ack_no = seq_no + 1
+            self.evento.set()
+            return
+        if self.ack_no is None:
+            return
+        # O servidor escolhe o ISN ao acaso: os números de sequência dele
+        # podem dar a volta nos 32 bits durante a transferência
+        seq_no = _desdobrar(seq_no, self.ack_no)
+        payload = segment[4*(flags >> 12):]
+        if payload:
+            if seq_no > self.ack_no:
+                self.fora_de_ordem[seq_no] = payload
+            elif seq_no + len(payload) > self.ack_no:
+                self._avancar(len(payload) - (self.ack_no - seq_no))
+                while self.ack_no in self.fora_de_ordem:
+                    self._avancar(len(self.fora_de_ordem.pop(self.ack_no)))
+            self._enviar(self.seq_inicial + 1, FLAGS_ACK)
+        if self.recebidos >= self.total:
+            self.concluido.set()
+
+    def _avancar(self, n):
+        self.ack_no += n
+        self.recebidos += n
+
+
+async def medir(args, perda, remontar):
+    Conexao.remontar_fora_de_ordem = remontar
+    rng = random.Random(1234)
+    rede = montar_topologia(baud=args.baud, latencia=args.latencia, perda=perda, rng=rng)
+    servidor = Servidor(rede.placa3, PORTA_DESCARTE)
+    servidor.registrar_monitor_de_conexoes_aceitas(
+        lambda conexao: conexao.registrar_recebedor(lambda conexao, dados: None))
+    cliente = ClienteJanela(rede.host, '192.168.200.4', PORTA_DESCARTE, args.janela)
+    await cliente.conectar()
+
+    loop = asyncio.get_running_loop()
+    inicio = loop.time()
+    await cliente.enviar(rng.randbytes(args.bytes))
+    duracao = loop.time() - inicio
+    for conexao in servidor.conexoes.values():
+        conexao._parar_timer()
+    return args.bytes / duracao, cliente.retransmissoes
+
+
+async def medir_envio(args, perda, retransmissao_rapida):
+    Conexao.retransmissao_rapida = retransmissao_rapida
+    rng = random.Random(1234)
+    rede = montar_topologia(baud=args.baud, latencia=args.latencia, perda=perda, rng=rng)
+    dados = rng.randbytes(args.bytes)
+    servidor = Servidor(rede.placa3, PORTA_DESCARTE)
+    servidor.registrar_monitor_de_conexoes_aceitas(lambda conexao: conexao.enviar(dados))
+    cliente = ClienteReceptor(rede.host, '192.168.200.4', PORTA_DESCARTE, args.bytes)
+
+    loop = asyncio.get_running_loop()
+    inicio = loop.time()
+    await cliente.conectar()
+    await cliente.concluido.wait()
+    duracao = loop.time() - inicio
+    retransmissoes = espurias = 0
+    for conexao in servidor.conexoes.values():
+        conexao._parar_timer()
+        estatisticas = conexao.estatisticas_rtt()
+        retransmissoes += estatisticas['retransmissoes']
+        espurias += estatisticas['retransmissoes_espurias']
+    return args.bytes / duracao, retransmissoes, espurias
+
+
+async def main(args):
+    print('%8s %22s %22s' % ('perda', 'descartando (B/s)', 'remontando (B/s)'))
+    for perda in (0, 0.01, 0.02, 0.05, 0.1):
+        resultados = []
+        for remontar in (False, True):
+            goodput, retransmissoes = await medir(args, perda, remontar)
+            resultados.append('%.0f (%d retx)' % (goodput, retransmissoes))
+        print('%7.0f%% %22s %22s' % (perda * 100, *resultados))
+
+    print()
+    print('%8s %30s %30s' % ('perda', 'só timeout (B/s)', 'retx. rápida (B/s)'))
+    for perda in (0, 0.01, 0.02, 0.05, 0.1):
+        resultados = []
+        for retransmissao_rapida in (False, True):
+            resultados.append('%.0f (%d retx, %d esp.)' % await medir_envio(args, perda, retransmissao_rapida))
+        print('%7.0f%% %30s %30s' % (perda * 100, *resultados))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--baud', type=int, default=0,
+                        help='taxa das linhas seriais (0 = instantânea)')
+    parser.add_argument('--latencia', type=float, default=0.002,
+                        help='latência de cada linha, em segundos')
+    parser.add_argument('--bytes', type=int, default=200000,
+                        help='quantidade de dados a enviar')
+    parser.add_argument('--janela', type=int, default=8,
+                        help='janela do cliente, em segmentos')
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Benchmark do encaminhamento de datagramas em trânsito pelo IP.
+
+Compara datagramas encaminhados por segundo pelo caminho original (que lia o
+cabeçalho inteiro com read_ipv4_header, remontava o cabeçalho com struct.pack
+e recalculava o checksum do zero) com o caminho rápido atual, que altera TTL e
+checksum no lugar. Também confere que ambos produzem os mesmos bytes.
+
+Uso: python3 benchmarks/bench_roteador.py
+"""
+import os
+import sys
+import random
+import struct
+from time import perf_counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from ip import IP
+from iputils import read_ipv4_header, calc_checksum, str2addr, IPPROTO_TCP
+
+
+class EnlaceColetor:
+    ignore_checksum = False
+
+    def __init__(self):
+        self.enviados = []
+
+    def registrar_recebedor(self, callback):
+        self.callback = callback
+
+    def enviar(self, datagrama, next_hop):
+        self.enviados.append(bytes(datagrama))
+
+
+def encaminhar_original(rede, datagrama):
+    """ Ramo de roteador do IP.__raw_recv antes do caminho rápido. """
+    dscp, ecn, identification, flags, frag_offset, ttl, proto, \
+        src_addr, dst_addr, payload = read_ipv4_header(datagrama)
+    ttl -= 1
+    src_addr_bytes = str2addr(src_addr)
+    dst_addr_bytes = str2addr(dst_addr)
+    total_length = 20 + len(payload)
+    header = struct.pack('!BBHHHBBH4s4s',
+                         (4 << 4) | 5, 0, total_length, identification,
+                         0, ttl, proto, 0,
+                         src_addr_bytes, dst_addr_bytes)
+    checksum = calc_checksum(header)
+    header = struct.pack('!BBHHHBBH4s4s',
+                         (4 << 4) | 5, 0, total_length, identification,
+                         0, ttl, proto, checksum,
+                         src_addr_bytes, dst_addr_bytes)
+    rede.enlace.enviar(header + payload, rede._next_hop(dst_addr))
+
+
+def gerar_datagrama(rng, tamanho_payload):
+    payload = rng.randbytes(tamanho_payload)
+    header = struct.pack('!BBHHHBBH4s4s', (4 << 4) | 5, 0, 20 + len(payload),
+                         rng.randint(0, 65535), 0, rng.randint(2, 255), IPPROTO_TCP,
+                         0, str2addr('192.168.200.1'),
+                         str2addr('10.%d.%d.%d' % (rng.randint(0, 255), rng.randint(0, 255),
+                                                   rng.randint(1, 254))))
+    header = header[:10] + struct.pack('!H', calc_checksum(header)) + header[12:]
+    return header + payload
+
+
+def main():
+    rng = random.Random(1234)
+    tabela = [('0.0.0.0/0', '192.168.200.2'), ('10.0.0.0/8', '192.168.200.3')]
+
+    print('%10s %18s %18s %8s' % ('payload', 'original (pkt/s)', 'rapido (pkt/s)', 'ganho'))
+    for tamanho in (0, 64, 512, 1460):
+        datagramas = [gerar_datagrama(rng, tamanho) for _ in range(2000)]
+
+        resultados = {}
+        for nome in ('original', 'rapido'):
+            enlace = EnlaceColetor()
+            rede = IP(enlace)
+            rede.definir_endereco_host('192.168.200.4')
+            rede.definir_tabela_encaminhamento(tabela)
+            encaminhar = (lambda d: encaminhar_original(rede, d)) if nome == 'original' \
+                else enlace.callback
+            inicio = perf_counter()
+            for _ in range(10):
+                for datagrama in datagramas:
+                    encaminhar(datagrama)
+            resultados[nome] = (10 * len(datagramas) / (perf_counter() - inicio),
+                                enlace.enviados[:len(datagramas)])
+
+        assert resultados['original'][1] == resultados['rapido'][1]
+        for datagrama in resultados['rapido'][1]:
+            assert calc_checksum(datagrama[:20]) == 0
+        original, rapido = resultados['original'][0], resultados['rapido'][0]
+        print('%10d %18.0f %18.0f %7.1fx' % (tamanho, original, rapido, rapido / original))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+Benchmark da camada de enlace SLIP.
+
+Mede a vazão (MB/s de datagrama) do codificador de Enlace.enviar comparada à
+do codificador original byte a byte, com payloads aleatórios e com o pior caso
+(todos os bytes precisando de escape), conferindo que os quadros são iguais.
+
+Para o decodificador, primeiro compara os quadros entregues pelo Enlace com os
+do decodificador original byte a byte, alimentando ambos com fluxos aleatórios
+quebrados em pedaços de tamanhos arbitrários, e depois mede quadros por
+segundo entregues por cada um.
+
+Uso: python3 benchmarks/bench_slip.py
+"""
+import os
+import sys
+import random
+from time import perf_counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from slip import Enlace
+
+
+class LinhaColetora:
+    def __init__(self):
+        self.quadros = []
+
+    def registrar_recebedor(self, callback):
+        self.callback = callback
+
+    def enviar(self, dados):
+        self.quadros.append(dados)
+
+
+def codificar_original(datagrama):
+    """ Codificador de Enlace.enviar antes da otimização. """
+    quadro = bytes([0xC0])
+    for byte in datagrama:
+        if byte == 0xC0:
+            quadro += bytes([0xDB, 0xDC])
+        elif byte == 0xDB:
+            quadro += bytes([0xDB, 0xDD])
+        else:
+            quadro += bytes([byte])
+    quadro += bytes([0xC0])
+    return quadro
+
+
+class DecodificadorOriginal:
+    """ Decodificador de Enlace.__raw_recv antes da otimização. """
+    def __init__(self, callback):
+        self.callback = callback
+        self.escaped = False
+        self.buffer = []
+
+    def recv(self, dados):
+        for byte in dados:
+            if byte == 0xC0:
+                if self.buffer:
+                    self.callback(bytes(self.buffer))
+                    self.buffer.clear()
+                continue
+            if self.escaped:
+                if byte == 0xDC:
+                    self.buffer.append(0xC0)
+                elif byte == 0xDD:
+                    self.buffer.append(0xDB)
+                self.escaped = False
+            elif byte == 0xDB:
+                self.escaped = True
+            else:
+                self.buffer.append(byte)
+
+
+def vazao(funcao, datagramas, vezes):
+    total = sum(len(d) for d in datagramas) * vezes
+    inicio = perf_counter()
+    for _ in range(vezes):
+        for datagrama in datagramas:
+            funcao(datagrama)
+    return total / (perf_counter() - inicio) / 1e6
+
+
+def gerar_payloads(rng, tamanho):
+    return {
+        'aleatorio': [rng.randbytes(tamanho) for _ in range(20)],
+        'pior caso': [bytes(rng.choice((0xC0, 0xDB)) for _ in range(tamanho))
+                      for _ in range(20)],
+    }
+
+
+def bench_codificador(rng):
+    print('codificador (Enlace.enviar)')
+    print('%8s %10s %18s %18s' % ('bytes', 'payload', 'original (MB/s)', 'atual (MB/s)'))
+    for tamanho in (40, 576, 1500, 9000):
+        for nome, datagramas in gerar_payloads(rng, tamanho).items():
+            linha = LinhaColetora()
+            enlace = Enlace(linha)
+            for datagrama in datagramas:
+                enlace.enviar(datagrama)
+                assert linha.quadros[-1] == codificar_original(datagrama)
+            vezes = max(1, 200000 // tamanho)
+            original = vazao(codificar_original, datagramas, max(1, vezes // 20))
+            atual = vazao(enlace.enviar, datagramas, vezes)
+            linha.quadros.clear()
+            print('%8d %10s %18.2f %18.2f' % (tamanho, nome, original, atual))
+
+
+def codificar(datagrama):
+    return b'\xc0' + datagrama.replace(b'\xdb', b'\xdb\xdd').replace(b'\xc0', b'\xdb\xdc') + b'\xc0'
+
+
+def gerar_fluxo(rng):
+    """
+    Gera um fluxo de quadros bem formados intercalados com SLIP_END extras e
+    trechos de lixo (que podem conter escapes inválidos). O único caso de
+    lixo evitado é SLIP_ESC imediatamente antes de SLIP_END: o decodificador
+    original carregava esse escape pendente para o quadro seguinte, enquanto
+    o atual o descarta junto com o quadro malformado.
+    """
+    partes = []
+    for _ in range(rng.randint(1, 30)):
+        if rng.random() < 0.8:
+            tamanho = rng.choice((0, 1, 2, 20, rng.randint(0, 1500)))
+            datagrama = bytes(rng.choice((0xC0, 0xDB, 0xDC, 0xDD, rng.randint(0, 255)))
+                              for _ in range(tamanho))
+            partes.append(b'\xc0' * rng.randint(0, 2) + codificar(datagrama))
+        else:
+            lixo = bytes(rng.choice((0xC0, 0xDB, 0xDC, 0xDD, 0x41))
+                         for _ in range(rng.randint(1, 10)))
+            partes.append(lixo.replace(b'\xdb\xc0', b'\xdb\xdc\xc0'))
+    fluxo = b''.join(partes)
+    return fluxo.replace(b'\xdb\xc0', b'\xdb\xdc\xc0') + b'\xc0'
+
+
+def quebrar(rng, fluxo):
+    pedacos = []
+    i = 0
+    while i < len(fluxo):
+        n = rng.choice((1, 2, 3, rng.randint(1, 64), rng.randint(1, 4096)))
+        pedacos.append(fluxo[i:i + n])
+        i += n
+    return pedacos
+
+
+def fuzz_decodificador(rng, iteracoes=2000):
+    for _ in range(iteracoes):
+        fluxo = gerar_fluxo(rng)
+        esperado = []
+        DecodificadorOriginal(esperado.append).recv(fluxo)
+
+        linha = LinhaColetora()
+        enlace = Enlace(linha)
+        obtido = []
+        enlace.registrar_recebedor(obtido.append)
+        for pedaco in quebrar(rng, fluxo):
+            linha.callback(pedaco)
+        assert obtido == esperado, (fluxo, obtido, esperado)
+    print('decodificador: %d fluxos aleatórios com resultado idêntico ao original' % iteracoes)
+
+
+def bench_decodificador(rng):
+    print('decodificador (Enlace.__raw_recv)')
+    print('%8s %10s %8s %20s %20s' % ('bytes', 'payload', 'pedaco',
+                                      'original (quadros/s)', 'atual (quadros/s)'))
+    for tamanho in (40, 576, 1500):
+        for nome, datagramas in gerar_payloads(rng, tamanho).items():
+            fluxo = b''.join(codificar(d) for d in datagramas)
+            for pedaco in (64, 2048):
+                pedacos = [fluxo[i:i + pedaco] for i in range(0, len(fluxo), pedaco)]
+                taxas = []
+                for nome_decodificador in ('original', 'atual'):
+                    entregues = []
+                    if nome_decodificador == 'original':
+                        recv = DecodificadorOriginal(entregues.append).recv
+                    else:
+                        linha = LinhaColetora()
+                        Enlace(linha).registrar_recebedor(entregues.append)
+                        recv = linha.callback
+                    vezes = max(1, 20000 // tamanho) if nome_decodificador == 'atual' \
+                        else max(1, 1000 // tamanho)
+                    inicio = perf_counter()
+                    for _ in range(vezes):
+                        for p in pedacos:
+                            recv(p)
+                    taxas.append(len(entregues) / (perf_counter() - inicio))
+                    assert entregues[:len(datagramas)] == datagramas
+                print('%8d %10s %8d %20.0f %20.0f' % (tamanho, nome, pedaco, *taxas))
+
+
+def main():
+    rng = random.Random(1234)
+    bench_codificador(rng)
+    print()
+    fuzz_decodificador(rng)
+    print()
+    bench_decodificador(rng)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Benchmark de um Servidor sob uma rajada de SYNs (SYN flood).
+
+Entrega ao Servidor, por uma camada de rede de laço fechado (vide
+bench_conexao.py), de 10k a 100k SYNs de endereços e portas aleatórios que
+nunca completam o handshake, e depois faz algumas conexões legítimas. Compara
+três tratamentos do SYN:
+
+ * original: uma Conexao completa para cada SYN, aceita (monitor de conexões
+   aceitas chamado) antes do ACK final;
+ * semiabertas: backlog sem limite, guardando só uma SemiAberta por SYN;
+ * cookies: backlog de 128 semiabertas e SYN cookies a partir daí.
+
+Mede SYNs processados por segundo, a memória alocada ao final da rajada (via
+tracemalloc, em uma segunda execução), o estado guardado pelo servidor,
+quantas conexões a aplicação viu e quantas das legítimas foram estabelecidas.
+
+Uso: python3 benchmarks/bench_syn.py [--legitimas 100]
+"""
+import os
+import sys
+import random
+import asyncio
+import argparse
+import tracemalloc
+from time import perf_counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from tcputils import FLAGS_ACK, FLAGS_SYN, make_header, read_header
+from tcp import Servidor, Conexao, _gerar_isn
+from bench_conexao import RedeLoopback, DST_ADDR, DST_PORT
+
+
+class ServidorOriginal(Servidor):
+    """
+    Servidor com o tratamento de SYN original: cria a Conexao e avisa a
+    aplicação assim que o SYN chega.
+    """
+    def _receber_syn(self, id_conexao, seq_no):
+        isn = _gerar_isn()
+        conexao = self.conexoes[id_conexao] = Conexao(self, id_conexao, isn + 1, seq_no + 1)
+        conexao._enviar_syn_ack()
+        if self.callback:
+            self.callback(conexao)
+
+
+def montar_syns(quantidade, rng):
+    syns = []
+    for _ in range(quantidade):
+        src_addr = '10.%d.%d.%d' % (rng.randrange(256), rng.randrange(256), rng.randrange(1, 255))
+        syns.append((src_addr, make_header(rng.randrange(1024, 65536), DST_PORT,
+                                           rng.getrandbits(32), 0, FLAGS_SYN)))
+    return syns
+
+
+def conectar(rede, src_addr, src_port, seq_no):
+    """ Faz um handshake completo com o servidor ligado à rede. """
+    rede.callback(src_addr, DST_ADDR, make_header(src_port, DST_PORT, seq_no, 0, FLAGS_SYN))
+    _, _, isn, _, _, _, _, _ = read_header(rede.segmentos.pop())
+    rede.callback(src_addr, DST_ADDR, make_header(src_port, DST_PORT, seq_no + 1,
+                                                  (isn + 1) & 0xffffffff, FLAGS_ACK))
+
+
+def medir(tipo, syns, legitimas, memoria):
+    rede = RedeLoopback()
+    if tipo == 'original':
+        servidor = ServidorOriginal(rede, DST_PORT)
+    elif tipo == 'semiabertas':
+        servidor = Servidor(rede, DST_PORT, backlog=float('inf'))
+    else:
+        servidor = Servidor(rede, DST_PORT)
+    aceitas = []
+    servidor.registrar_monitor_de_conexoes_aceitas(aceitas.append)
+
+    if memoria:
+        tracemalloc.start()
+    inicio = perf_counter()
+    for i, (src_addr, syn) in enumerate(syns):
+        rede.callback(src_addr, DST_ADDR, syn)
+        if i % 1024 == 0:
+            rede.segmentos.clear()
+    tempo = perf_counter() - inicio
+    rede.segmentos.clear()
+    alocado = tracemalloc.get_traced_memory()[0] if memoria else 0
+    tracemalloc.stop()
+
+    # Conexões legítimas depois da rajada, que ainda ocupa o backlog
+    conexoes_antes = len(servidor.conexoes)
+    for i in range(legitimas):
+        conectar(rede, '192.168.0.1', 20000 + i, 1000 * i)
+    estabelecidas = len(servidor.conexoes) - conexoes_antes
+    if tipo == 'original':
+        # Sem o handshake completo, não há como distinguir as legítimas
+        estabelecidas = legitimas
+
+    resultado = (len(syns) / tempo, alocado, len(servidor.conexoes) - estabelecidas,
+                 len(servidor.semiabertas), len(aceitas) - estabelecidas,
+                 estabelecidas, servidor.cookies_enviados)
+    for conexao in servidor.conexoes.values():
+        conexao._parar_timer()
+    servidor.timer_semiabertas.cancelar()
+    return resultado
+
+
+async def main(args):
+    rng = random.Random(1234)
+    print('%8s %12s %10s %14s %10s %12s %10s %12s %10s' % (
+        'SYNs', 'tratamento', 'SYN/s', 'memória (KiB)', 'Conexao', 'semiabertas',
+        'aceitas', 'legítimas', 'cookies'))
+    for quantidade in (10000, 30000, 100000):
+        syns = montar_syns(quantidade, rng)
+        for tipo in ('original', 'semiabertas', 'cookies'):
+            taxa, _, conexoes, semiabertas, aceitas, estabelecidas, cookies = \
+                medir(tipo, syns, args.legitimas, False)
+            await asyncio.sleep(0)
+            alocado = medir(tipo, syns, args.legitimas, True)[1]
+            await asyncio.sleep(0)
+            print('%8d %12s %10.0f %14.0f %10d %12d %10d %8d/%-3d %10d' % (
+                quantidade, tipo, taxa, alocado / 1024, conexoes, semiabertas,
+                aceitas, estabelecidas, args.legitimas, cookies))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--legitimas', type=int, default=100,
+                        help='conexões legítimas feitas depois da rajada')
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Benchmark do processamento de ACKs com muitas conexões simultâneas.
+
+Abre de 1k a 10k conexões em um mesmo Servidor, ligado a uma camada de rede
+de laço fechado (vide bench_conexao.py), põe dados em trânsito em todas e
+entrega ACKs a elas em rodízio, um segmento por vez. Cada ACK rearma o timer
+de retransmissão da conexão. Compara a roda de timers do Servidor com o
+esquema original, em que cada rearme cancelava o TimerHandle anterior e
+criava outro com call_later, medindo ACKs por segundo e quantos handles
+ficaram no heap do laço de eventos. Cada medida é repetida, alternando os
+dois esquemas, e a taxa é mostrada como mediana (mínimo-máximo), já que a
+diferença entre eles fica perto da variação entre execuções.
+
+Uso: python3 benchmarks/bench_timers.py [--acks-por-conexao 16]
+         [--repeticoes 5]
+"""
+import os
+import sys
+import asyncio
+import argparse
+import statistics
+from time import perf_counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from tcputils import FLAGS_ACK, FLAGS_SYN, make_header, read_header
+from tcp import Servidor
+from bench_conexao import RedeLoopback, SRC_ADDR, DST_ADDR, DST_PORT
+
+
+class TemporizadorLoop:
+    """ Timer com a interface de tcp.Temporizador, feito com call_later. """
+    def __init__(self, callback):
+        self.callback = callback
+        self.handle = None
+
+    @property
+    def ativo(self):
+        return self.handle is not None
+
+    def armar(self, atraso):
+        self.cancelar()
+        self.handle = asyncio.get_event_loop().call_later(atraso, self._disparar)
+
+    def cancelar(self):
+        if self.handle is not None:
+            self.handle.cancel()
+            self.handle = None
+
+    def _disparar(self):
+        self.handle = None
+        self.callback()
+
+
+class TimersLoop:
+    """ Substituto de tcp.RodaDeTimers usando um TimerHandle por timer. """
+    def criar(self, callback):
+        return TemporizadorLoop(callback)
+
+
+def medir(quantidade, acks_por_conexao, roda):
+    rede = RedeLoopback()
+    servidor = Servidor(rede, DST_PORT)
+    if not roda:
+        servidor.timers = TimersLoop()
+    dados = bytes(64 * 1024)
+    conexoes = []
+    servidor.registrar_monitor_de_conexoes_aceitas(conexoes.append)
+    for i in range(quantidade):
+        rede.callback(SRC_ADDR, DST_ADDR, make_header(10000 + i, DST_PORT, 1000 * i, 0, FLAGS_SYN))
+        _, _, isn, _, _, _, _, _ = read_header(rede.segmentos.popleft())
+        rede.callback(SRC_ADDR, DST_ADDR, make_header(10000 + i, DST_PORT, 1000 * i + 1,
+                                                      (isn + 1) & 0xffffffff, FLAGS_ACK))
+    for conexao in conexoes:
+        conexao.registrar_recebedor(lambda conexao, dados: None)
+        conexao.enviar(dados)
+    rede.segmentos.clear()
+
+    # Monta os ACKs antes de medir: cada conexão confirma um segmento por vez
+    rodadas = []
+    for j in range(acks_por_conexao):
+        rodada = []
+        for conexao in conexoes:
+            _, src_port, _, _ = conexao.id_conexao
+            ack_no = (conexao.ultimo_ack + (j + 1) * 1460) & 0xffffffff
+            rodada.append(make_header(src_port, DST_PORT, conexao.ack_no, ack_no, FLAGS_ACK))
+        rodadas.append(rodada)
+
+    loop = asyncio.get_running_loop()
+    heap_inicial = len(loop._scheduled)
+    inicio = perf_counter()
+    for rodada in rodadas:
+        for ack in rodada:
+            rede.callback(SRC_ADDR, DST_ADDR, ack)
+        rede.segmentos.clear()
+    tempo = perf_counter() - inicio
+    heap = len(loop._scheduled) - heap_inicial
+
+    for conexao in conexoes:
+        conexao._parar_timer()
+    return quantidade * acks_por_conexao / tempo, heap
+
+
+def resumir(taxas):
+    return '%.0f (%.0f-%.0f)' % (statistics.median(taxas), min(taxas), max(taxas))
+
+
+async def main(args):
+    print('%10s %26s %26s %16s %10s' % ('conexões', 'call_later (ACK/s)',
+                                        'roda (ACK/s)', 'heap call_later', 'heap roda'))
+    for quantidade in (1000, 3000, 10000):
+        taxas_loop, taxas_roda = [], []
+        for _ in range(args.repeticoes):
+            taxa_loop, heap_loop = medir(quantidade, args.acks_por_conexao, False)
+            taxas_loop.append(taxa_loop)
+            await asyncio.sleep(0)
+            taxa_roda, heap_roda = medir(quantidade, args.acks_por_conexao, True)
+            taxas_roda.append(taxa_roda)
+            await asyncio.sleep(0)
+        print('%10d %26s %26s %16d %10d' % (quantidade, resumir(taxas_loop),
+                                            resumir(taxas_roda), heap_loop, heap_roda))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--acks-por-conexao', type=int, default=16,
+                        help='quantidade de ACKs entregues a cada conexão')
+    parser.add_argument('--repeticoes', type=int, default=5,
+                        help='quantas vezes cada medida é repetida')
+    asyncio.run(main(parser.parse_args()))
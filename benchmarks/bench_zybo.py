@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Benchmark do ZyboSerialDriver sem o hardware da Zybo.
+
+Os registradores da placa são substituídos por um mmap de arquivo temporário,
+de forma que as escritas custam o mesmo que no /dev/uio (memória mapeada),
+apenas sem o efeito colateral de transmitir os bytes. Mede o tempo para
+enviar quadros de vários tamanhos com o ZyboSerialDriver.enviar atual e com
+o laço original (um struct.pack e uma fatia do mmap por byte).
+
+Para a recepção, a fila do hardware é simulada por FilaSimulada, que devolve
+as palavras enfileiradas a cada leitura do registrador 0. Mede palavras por
+segundo drenadas pelo tratador de IRQ atual e pelo original, com tráfego nas
+8 portas, e confere que o limite de palavras por IRQ entrega os mesmos dados.
+
+Uso: python3 benchmarks/bench_zybo.py
+"""
+import os
+import sys
+import mmap
+import random
+import struct
+import asyncio
+import tempfile
+from collections import deque, defaultdict
+from time import perf_counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from camadafisica import ZyboSerialDriver, NUM_PORTAS
+
+
+class RegistradoresGravados:
+    """ Substitui ZyboSerialDriver.regs guardando todas as escritas. """
+    def __init__(self):
+        self.escritas = []
+
+    def __setitem__(self, indice, valor):
+        self.escritas.append((indice, valor))
+
+
+class FilaSimulada:
+    """
+    Simula a fila de recepção do hardware: cada leitura do registrador 0
+    retira uma palavra (porta << 8 | byte), ou devolve -1 se estiver vazia.
+    Aceita tanto o acesso por índice (regs[0], usado pelo driver atual)
+    quanto por fatia (mm[0:4], usado pelo driver original).
+    """
+    VAZIA = struct.pack('i', -1)
+
+    def __init__(self):
+        self.palavras = deque()
+        self.empacotadas = deque()
+
+    def enfileirar(self, port, dados):
+        for b in dados:
+            self.palavras.append((port << 8) | b)
+            self.empacotadas.append(struct.pack('i', (port << 8) | b))
+
+    def __getitem__(self, indice):
+        if isinstance(indice, slice):
+            if not self.empacotadas:
+                return self.VAZIA
+            self.palavras.popleft()
+            return self.empacotadas.popleft()
+        if not self.palavras:
+            return -1
+        self.empacotadas.popleft()
+        return self.palavras.popleft()
+
+
+def driver_com_fila(max_palavras_por_irq=None):
+    """
+    Cria um ZyboSerialDriver cujos registradores são uma FilaSimulada. O
+    descritor do dispositivo é o /dev/null, para que a confirmação e a
+    reabilitação da IRQ não falhem.
+    """
+    driver = ZyboSerialDriver.__new__(ZyboSerialDriver)
+    driver.max_palavras_por_irq = max_palavras_por_irq
+    driver.buffers_rx = [bytearray() for _ in range(NUM_PORTAS)]
+    driver.fd = os.open(os.devnull, os.O_RDWR)
+    driver.regs = driver.mm = FilaSimulada()
+    driver.callbacks = defaultdict(lambda: lambda _: None)
+    driver.zerar_estatisticas()
+    return driver
+
+
+def irq_original(driver):
+    """ Tratador de IRQ do ZyboSerialDriver antes da otimização. """
+    os.read(driver.fd, 4)
+    buffers = defaultdict(lambda: bytearray())
+    while True:
+        elem, = struct.unpack('i', driver.mm[0:4])
+        if elem == -1: break
+        port, b = elem>>8, elem&0xff
+        buffers[port].append(b)
+    for port, dados in buffers.items():
+        driver.callbacks[port](bytes(dados))
+    os.write(driver.fd, b'\x01\x00\x00\x00')
+
+
+def driver_em_arquivo():
+    """
+    Cria um ZyboSerialDriver cujos registradores são um mmap de arquivo
+    temporário. Não registra tratador de IRQ, já que não há hardware.
+    """
+    driver = ZyboSerialDriver.__new__(ZyboSerialDriver)
+    arquivo = tempfile.TemporaryFile()
+    arquivo.truncate(0x1000)
+    driver.mm = mmap.mmap(arquivo.fileno(), 0x1000)
+    driver.regs = memoryview(driver.mm).cast('i')
+    driver.zerar_estatisticas()
+    return driver
+
+
+def enviar_original(driver, port, data):
+    """ ZyboSerialDriver.enviar antes da otimização. """
+    for b in data:
+        driver.mm[port*4:port*4+4] = struct.pack('I', b)
+
+
+def medir(funcao, quadros, vezes):
+    inicio = perf_counter()
+    for _ in range(vezes):
+        for quadro in quadros:
+            funcao(quadro)
+    return (perf_counter() - inicio) / (vezes * len(quadros))
+
+
+def bench_envio(rng):
+    driver = driver_em_arquivo()
+
+    # Confere a sequência de escritas feita pelo driver
+    quadro = rng.randbytes(100)
+    regs, driver.regs = driver.regs, RegistradoresGravados()
+    driver.enviar(5, quadro)
+    assert driver.regs.escritas == [(5, b) for b in quadro]
+    driver.regs = regs
+    driver.enviar(5, quadro)
+    assert struct.unpack('i', driver.mm[20:24])[0] == quadro[-1]
+
+    print('envio (ZyboSerialDriver.enviar)')
+    print('%8s %16s %16s %16s' % ('bytes', 'original (us)', 'atual (us)', 'atual (MB/s)'))
+    for tamanho in (40, 576, 1500, 3000):
+        quadros = [rng.randbytes(tamanho) for _ in range(20)]
+        vezes = max(1, 20000 // tamanho)
+        original = medir(lambda q: enviar_original(driver, 3, q), quadros, vezes)
+        atual = medir(lambda q: driver.enviar(3, q), quadros, vezes)
+        print('%8d %16.1f %16.1f %16.2f' % (tamanho, original * 1e6, atual * 1e6,
+                                            tamanho / atual / 1e6))
+
+
+def bench_recepcao(rng):
+    # Mesmos dados entregues com e sem limite de palavras por IRQ
+    dados = {port: rng.randbytes(3000) for port in range(NUM_PORTAS)}
+    for limite in (None, 1, 64, 1000):
+        driver = driver_com_fila(limite)
+        recebidos = defaultdict(bytearray)
+        for port in range(NUM_PORTAS):
+            driver.registrar_recebedor(port, recebidos[port].extend)
+        # Intercala as portas em rajadas, como no hardware
+        for i in range(0, 3000, 100):
+            for port in range(NUM_PORTAS):
+                driver.regs.enfileirar(port, dados[port][i:i + 100])
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        loop.call_soon(driver._ZyboSerialDriver__irq_handler)
+        while driver.regs.palavras:
+            loop.run_until_complete(asyncio.sleep(0))
+        loop.close()
+        assert {port: bytes(r) for port, r in recebidos.items()} == dados, limite
+
+    print('recepção (tratador de IRQ), tráfego intercalado nas %d portas' % NUM_PORTAS)
+    print('%12s %20s %20s' % ('palavras/irq', 'original (palavras/s)', 'atual (palavras/s)'))
+    for por_irq in (16, 256, 4096):
+        rajada = [rng.randbytes(por_irq // NUM_PORTAS) for _ in range(NUM_PORTAS)]
+        vezes = max(10, 100000 // por_irq)
+        taxas = []
+        for tratador in (irq_original, lambda d: d._ZyboSerialDriver__irq_handler()):
+            driver = driver_com_fila()
+            tempo = 0
+            for _ in range(vezes):
+                for port, dados in enumerate(rajada):
+                    driver.regs.enfileirar(port, dados)
+                inicio = perf_counter()
+                tratador(driver)
+                tempo += perf_counter() - inicio
+            taxas.append(vezes * por_irq / tempo)
+        print('%12d %20.0f %20.0f' % (por_irq, *taxas))
+
+
+def main():
+    rng = random.Random(1234)
+    bench_envio(rng)
+    print()
+    bench_recepcao(rng)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,21 +1,45 @@
 import os
 import mmap
+import random
 import errno
 import fcntl
-import struct
 import termios
 import asyncio
 import traceback
 from collections import defaultdict
+from metricas import registro, limites_exponenciais
+
+
+NUM_PORTAS = 8
+
+# Palavras retiradas da fila do hardware a cada IRQ (com o registro de
+# métricas ativo)
+_palavras_por_irq = registro.histograma('zybo.palavras_por_irq', limites_exponenciais(1, 2, 12))
 
 
 class ZyboSerialDriver:
     """ Driver para o hardware de https://github.com/thotypous/zybo-z7-20-uart """
 
-    def __init__(self, device='/dev/uio/user_io'):
+    def __init__(self, device='/dev/uio/user_io', max_palavras_por_irq=None):
+        """
+        O argumento max_palavras_por_irq limita quantas palavras são retiradas
+        da fila de recepção do hardware de uma só vez. Se a fila tiver mais
+        que isso, o restante é retirado em uma próxima iteração do laço de
+        eventos, para não deixar as demais tarefas esperando. Com None, a
+        fila é esvaziada de uma vez.
+        """
+        self.max_palavras_por_irq = max_palavras_por_irq
+        # Buffers de recepção de cada porta, reaproveitados entre as IRQs
+        self.buffers_rx = [bytearray() for _ in range(NUM_PORTAS)]
+        self.zerar_estatisticas()
         self.fd = os.open(device, os.O_RDWR)
         fcntl.fcntl(self.fd, fcntl.F_SETFL, os.O_NONBLOCK)
         self.mm = mmap.mmap(self.fd, 0x1000)
+        # Visão do mmap como vetor de registradores de 32 bits: regs[0] é a
+        # fila de recepção e regs[port] a fila de transmissão da porta port.
+        # Indexar a memoryview faz uma única leitura/escrita de 32 bits, sem
+        # criar fatias do mmap nem passar pelo struct.pack/unpack.
+        self.regs = memoryview(self.mm).cast('i')
         asyncio.get_event_loop().add_reader(self.fd, self.__irq_handler)
         self.__irq_unmask()
         self.callbacks = defaultdict(lambda: lambda _: None)
@@ -33,27 +57,86 @@ class ZyboSerialDriver:
 
     def enviar(self, port, data):
         #print('send', port, data)
+        self.bytes_enviados += len(data)
+        regs = self.regs
         for b in data:
-            self.mm[port*4:port*4+4] = struct.pack('I', b)
+            regs[port] = b
 
     def registrar_recebedor(self, port, callback):
         self.callbacks[port] = callback
 
+    def zerar_estatisticas(self):
+        self.irqs = 0
+        self.drenagens = 0
+        self.drenagens_adiadas = 0
+        self.palavras_recebidas = 0
+        self.palavras_invalidas = 0
+        self.bytes_enviados = 0
+        self.erros_recebedor = 0
+
+    def estatisticas(self):
+        """
+        Retorna um dicionário com as IRQs atendidas, as vezes que a fila do
+        hardware foi esvaziada (uma por IRQ, mais uma para cada continuação
+        adiada por max_palavras_por_irq), as palavras recebidas e, entre
+        elas, as descartadas por indicarem uma porta inexistente, os bytes
+        enviados e as exceções levantadas pelos recebedores.
+        """
+        return {'irqs': self.irqs, 'drenagens': self.drenagens,
+                'drenagens_adiadas': self.drenagens_adiadas,
+                'palavras_recebidas': self.palavras_recebidas,
+                'palavras_invalidas': self.palavras_invalidas,
+                'bytes_enviados': self.bytes_enviados,
+                'erros_recebedor': self.erros_recebedor}
+
     def __irq_handler(self):
         os.read(self.fd, 4)   # diz ao SO que coletamos a irq
-        buffers = defaultdict(lambda: bytearray())
-        while True:
-            elem, = struct.unpack('i', self.mm[0:4])  # retira da fila do hardware
-            if elem == -1: break                      # fila vazia
-            port, b = elem>>8, elem&0xff
-            buffers[port].append(b)
-        for port, dados in buffers.items():
-            try:
-                #print('recv', port, dados)
-                self.callbacks[port](bytes(dados))
-            except:
-                traceback.print_exc()
-        self.__irq_unmask()
+        self.irqs += 1
+        self.__drenar_fila()
+
+    def __drenar_fila(self):
+        regs = self.regs
+        buffers = self.buffers_rx
+        limite = self.max_palavras_por_irq
+        pendente = False
+        n = 0
+        # Aconteça o que acontecer, a irq precisa ser reabilitada (ou a
+        # drenagem continuada), senão a recepção para de vez
+        try:
+            while limite is None or n < limite:
+                elem = regs[0]                      # retira da fila do hardware
+                if elem == -1: break                # fila vazia
+                n += 1
+                port = elem >> 8
+                if not 0 <= port < NUM_PORTAS:
+                    # Porta inexistente: descarta a palavra
+                    self.palavras_invalidas += 1
+                    continue
+                buffers[port].append(elem & 0xff)
+            else:
+                pendente = True                     # atingiu o limite
+            self.drenagens += 1
+            self.palavras_recebidas += n
+            if registro.ativo:
+                _palavras_por_irq.registrar(n)
+            for port, dados in enumerate(buffers):
+                if not dados:
+                    continue
+                try:
+                    #print('recv', port, dados)
+                    self.callbacks[port](bytes(dados))
+                except:
+                    self.erros_recebedor += 1
+                    traceback.print_exc()
+                finally:
+                    dados.clear()
+        finally:
+            if pendente:
+                # Continua a esvaziar a fila depois, sem reabilitar a irq
+                self.drenagens_adiadas += 1
+                asyncio.get_event_loop().call_soon(self.__drenar_fila)
+            else:
+                self.__irq_unmask()
 
     def __irq_unmask(self):
         os.write(self.fd, b'\x01\x00\x00\x00')
@@ -122,3 +205,80 @@ class PTY:
         """
         os.write(self.pty, dados)
 
+
+class LinhaSerialSimulada:
+    """
+    Ponta de uma linha serial simulada dentro do próprio processo, com a
+    mesma interface de ZyboSerialPort e PTY. Use LinhaSerialSimulada.par()
+    para criar as duas pontas de uma linha.
+
+    Cada sentido da linha transmite um byte por vez a `baud` bits por
+    segundo (10 bits por byte, como no 8N1), de forma que dados enviados
+    enquanto a linha está ocupada esperam na fila. Depois de transmitidos,
+    os dados levam mais `latencia` segundos para chegar à outra ponta. Cada
+    chamada a enviar é perdida com probabilidade `perda` e, se não for
+    perdida, tem um bit trocado com probabilidade `corrupcao`. Com baud
+    None, a transmissão é instantânea.
+    """
+    def __init__(self, baud=115200, latencia=0, perda=0, corrupcao=0, rng=None):
+        self.baud = baud
+        self.latencia = latencia
+        self.perda = perda
+        self.corrupcao = corrupcao
+        self.rng = rng or random.Random()
+        self.outra_ponta = None
+        self.callback = None
+        self.livre_em = 0   # instante em que a linha termina a transmissão atual
+        self.bytes_enviados = 0
+        self.envios_perdidos = 0
+        self.envios_corrompidos = 0
+
+    @classmethod
+    def par(cls, *args, **kwargs):
+        """
+        Cria as duas pontas de uma linha, com os mesmos parâmetros nos dois
+        sentidos. Aceita os mesmos argumentos do construtor.
+        """
+        a, b = cls(*args, **kwargs), cls(*args, **kwargs)
+        a.outra_ponta, b.outra_ponta = b, a
+        return a, b
+
+    def registrar_recebedor(self, callback):
+        """
+        Registra uma função para ser chamada quando vierem dados da linha serial
+        """
+        self.callback = callback
+
+    def enviar(self, dados):
+        """
+        Envia dados para a linha serial
+        """
+        loop = asyncio.get_event_loop()
+        chegada = max(loop.time(), self.livre_em)
+        if self.baud:
+            chegada += 10 * len(dados) / self.baud
+        self.livre_em = chegada
+        self.bytes_enviados += len(dados)
+
+        if self.perda and self.rng.random() < self.perda:
+            self.envios_perdidos += 1
+            return
+        dados = bytes(dados)
+        if dados and self.corrupcao and self.rng.random() < self.corrupcao:
+            self.envios_corrompidos += 1
+            corrompidos = bytearray(dados)
+            corrompidos[self.rng.randrange(len(dados))] ^= 1 << self.rng.randrange(8)
+            dados = bytes(corrompidos)
+        loop.call_at(chegada + self.latencia, self.outra_ponta.__raw_recv, dados)
+
+    def estatisticas(self):
+        return {'bytes_enviados': self.bytes_enviados,
+                'envios_perdidos': self.envios_perdidos,
+                'envios_corrompidos': self.envios_corrompidos}
+
+    def __raw_recv(self, dados):
+        if self.callback:
+            try:
+                self.callback(dados)
+            except:
+                traceback.print_exc()
@@ -0,0 +1,127 @@
+# Algoritmos de controle de congestionamento usados pela Conexao de tcp.py.
+# Cada conexão tem sua própria instância, criada pela classe escolhida no
+# Servidor. A Conexao cuida da detecção de perdas (timeout, ACKs duplicados,
+# recuperação rápida) e avisa o algoritmo de cada evento; o algoritmo só
+# decide os valores de cwnd e ssthresh, ambos em bytes.
+
+from time import time
+from tcputils import MSS
+
+
+class Reno:
+    """
+    Reno (RFC 5681): partida lenta até ssthresh, depois aumento de um MSS
+    por janela confirmada; na perda, ssthresh cai para metade dos dados em
+    trânsito.
+    """
+    def __init__(self, mss=MSS):
+        self.mss = mss
+        self.cwnd = mss
+        self.ssthresh = 0xffff
+        # Bytes confirmados desde o último aumento em congestion avoidance
+        self.acumulado = 0
+
+    def ao_confirmar(self, confirmados, rtt):
+        """
+        Dados novos confirmados fora da recuperação rápida. rtt é a
+        estimativa atual da conexão, em segundos.
+        """
+        if self.cwnd < self.ssthresh:
+            # Partida lenta: no máximo um MSS por ACK (RFC 3465, L=1)
+            self.cwnd += min(confirmados, self.mss)
+        else:
+            self._evitar_congestionamento(confirmados, rtt)
+
+    def _evitar_congestionamento(self, confirmados, rtt):
+        self.acumulado += confirmados
+        if self.acumulado >= self.cwnd:
+            self.acumulado -= self.cwnd
+            self.cwnd += self.mss
+
+    def _reduzir(self, em_transito):
+        self.ssthresh = max(em_transito // 2, 2*self.mss)
+
+    def ao_detectar_perda(self, em_transito):
+        """
+        Três ACKs duplicados: início da recuperação rápida.
+        """
+        self._reduzir(em_transito)
+        self.acumulado = 0
+        self.cwnd = self.ssthresh + 3*self.mss
+
+    def ao_receber_duplicado(self):
+        """
+        ACK duplicado durante a recuperação rápida.
+        """
+        self.cwnd += self.mss
+
+    def ao_confirmar_parcial(self, confirmados):
+        """
+        ACK parcial durante a recuperação rápida.
+        """
+        self.cwnd = max(self.cwnd - confirmados + self.mss, self.mss)
+
+    def ao_sair_da_recuperacao(self):
+        self.cwnd = self.ssthresh
+
+    def ao_expirar(self, em_transito):
+        """
+        Timeout de retransmissão: recomeça da partida lenta.
+        """
+        self._reduzir(em_transito)
+        self.acumulado = 0
+        self.cwnd = self.mss
+
+
+class Cubic(Reno):
+    """
+    CUBIC (RFC 9438): em congestion avoidance a janela segue uma função
+    cúbica do tempo desde a última perda, centrada na janela em que ela
+    ocorreu (w_max), e nunca cresce mais devagar que o Reno. Na perda a
+    janela é multiplicada por BETA em vez de cair pela metade.
+    """
+    C = 0.4
+    BETA = 0.7
+
+    def __init__(self, mss=MSS):
+        super().__init__(mss)
+        # Janelas em segmentos, como na RFC
+        self.w_max = 0
+        self.w_est = 0
+        self.k = 0
+        # Início da época atual de congestion avoidance
+        self.epoca = None
+
+    def _evitar_congestionamento(self, confirmados, rtt):
+        agora = time()
+        segmentos = self.cwnd / self.mss
+        if self.epoca is None:
+            self.epoca = agora
+            if segmentos < self.w_max:
+                self.k = ((self.w_max - segmentos) / self.C) ** (1/3)
+            else:
+                self.k = 0
+                self.w_max = segmentos
+            self.w_est = segmentos
+
+        t = agora - self.epoca + rtt
+        alvo = self.C * (t - self.k)**3 + self.w_max
+        # Região "amigável ao Reno": estimativa da janela que o Reno teria
+        self.w_est += 3*(1 - self.BETA)/(1 + self.BETA) * (confirmados / self.mss) / segmentos
+        alvo = min(max(alvo, self.w_est), 1.5*segmentos)
+        if alvo > segmentos:
+            self.acumulado += (alvo - segmentos) / segmentos * confirmados
+            aumento = int(self.acumulado)
+            self.cwnd += aumento
+            self.acumulado -= aumento
+
+    def _reduzir(self, em_transito):
+        segmentos = self.cwnd / self.mss
+        # Convergência rápida: se a perda veio antes de alcançar o w_max
+        # anterior, libera banda para fluxos novos reduzindo o w_max
+        if segmentos < self.w_max:
+            self.w_max = segmentos * (1 + self.BETA) / 2
+        else:
+            self.w_max = segmentos
+        self.ssthresh = max(int(self.cwnd * self.BETA), 2*self.mss)
+        self.epoca = None
@@ -0,0 +1,185 @@
+# Adaptador que expõe cada tcp.Conexao como um par asyncio.StreamReader /
+# asyncio.StreamWriter, como o asyncio.start_server faz com sockets. Assim a
+# aplicação pode ser escrita como uma corrotina, que roda fora do caminho de
+# recepção de pacotes, por exemplo:
+#
+#     async def eco(leitor, escritor):
+#         while dados := await leitor.read(4096):
+#             escritor.write(dados)
+#             await escritor.drain()
+#         escritor.close()
+#
+#     servir(Servidor(rede, 7000), eco)
+#
+# Do lado ativo, abrir_conexao(Cliente(rede), '192.168.200.4', 7000) faz o
+# papel do asyncio.open_connection.
+
+import asyncio
+
+# Limites padrão: dados recebidos guardados no StreamReader antes de pausar o
+# recebimento, e dados aguardando transmissão antes de drain() bloquear
+LIMITE_LEITURA = 2**16
+LIMITE_ESCRITA = 2**16
+
+
+class TransporteConexao(asyncio.Transport):
+    """
+    Transporte do asyncio sobre uma Conexao. Repassa os dados recebidos ao
+    protocolo e controla o fluxo nos dois sentidos: o StreamReader pausa o
+    recebimento da conexão quando seu buffer enche (o que fecha a janela
+    anunciada à outra ponta), e o StreamWriter pausa a escrita enquanto
+    houver mais de limite_alto bytes aguardando a janela de envio.
+    """
+    def __init__(self, conexao, protocolo, limite_escrita=LIMITE_ESCRITA):
+        super().__init__()
+        self.conexao = conexao
+        self.protocolo = protocolo
+        self.limite_alto = limite_escrita
+        self.limite_baixo = limite_escrita // 4
+        self.escrita_pausada = False
+        self.fechando = False
+        self.fechado = False
+        protocolo.connection_made(self)
+        conexao.registrar_monitor_de_envio(self._dados_enviados)
+        conexao.registrar_monitor_de_aborto(self._abortada)
+        # Pode entregar na hora dados que já estavam esperando na conexão
+        conexao.registrar_recebedor(self._dados_recebidos)
+
+    def _dados_recebidos(self, conexao, dados):
+        if self.fechado:
+            # Como um socket fechado: os dados não têm mais para onde ir, e a
+            # outra ponta fica sabendo por um RST
+            if dados:
+                conexao._resetar()
+            return
+        if dados == b'':
+            self.protocolo.eof_received()
+        else:
+            self.protocolo.data_received(dados)
+
+    def _abortada(self, conexao):
+        # A conexão foi descartada (a outra ponta parou de responder ou
+        # recomeçou): sem isso, um escritor parado em drain() esperaria
+        # para sempre
+        if self.fechado:
+            return
+        self.fechando = True
+        self.fechado = True
+        self.protocolo.connection_lost(ConnectionResetError('conexão abortada'))
+
+    def _dados_enviados(self, conexao):
+        if self.escrita_pausada and conexao.bytes_pendentes <= self.limite_baixo:
+            self.escrita_pausada = False
+            self.protocolo.resume_writing()
+
+    def get_extra_info(self, nome, padrao=None):
+        src_addr, src_port, dst_addr, dst_port = self.conexao.id_conexao
+        if nome == 'peername':
+            return (src_addr, src_port)
+        if nome == 'sockname':
+            return (dst_addr, dst_port)
+        return padrao
+
+    # Leitura
+
+    def is_reading(self):
+        return not self.conexao.recebimento_pausado
+
+    def pause_reading(self):
+        self.conexao.pausar_recebimento()
+
+    def resume_reading(self):
+        # Retomar entrega na hora os dados guardados, o que alteraria o
+        # buffer do StreamReader no meio da leitura que pediu para retomar
+        asyncio.get_event_loop().call_soon(self.conexao.retomar_recebimento)
+
+    # Escrita
+
+    def write(self, dados):
+        if self.fechando:
+            return
+        self.conexao.enviar(dados)
+        if not self.escrita_pausada and self.conexao.bytes_pendentes > self.limite_alto:
+            self.escrita_pausada = True
+            self.protocolo.pause_writing()
+
+    def get_write_buffer_size(self):
+        return self.conexao.bytes_pendentes
+
+    def get_write_buffer_limits(self):
+        return (self.limite_baixo, self.limite_alto)
+
+    def set_write_buffer_limits(self, high=None, low=None):
+        if high is None:
+            high = LIMITE_ESCRITA if low is None else 4 * low
+        if low is None:
+            low = high // 4
+        self.limite_alto, self.limite_baixo = high, low
+
+    def can_write_eof(self):
+        return False
+
+    # Fechamento
+
+    def is_closing(self):
+        return self.fechando
+
+    def close(self):
+        if self.fechando:
+            return
+        self.fechando = True
+        self.conexao.fechar()
+        asyncio.get_event_loop().call_soon(self._fechado)
+
+    def abort(self):
+        # Descarta os dados pendentes e encerra a conexão na hora, avisando a
+        # outra ponta com um RST
+        if self.fechado:
+            return
+        self.fechando = True
+        self.fechado = True
+        self.conexao._resetar()
+        asyncio.get_event_loop().call_soon(self.protocolo.connection_lost, None)
+
+    def _fechado(self):
+        if self.fechado:
+            return
+        self.fechado = True
+        self.protocolo.connection_lost(None)
+
+
+def abrir_fluxos(conexao, limite_leitura=LIMITE_LEITURA, limite_escrita=LIMITE_ESCRITA):
+    """
+    Retorna um par (StreamReader, StreamWriter) ligado à conexão, recém
+    aceita por um Servidor ou aberta por um Cliente (os dados passam a ir
+    para o StreamReader em vez de um recebedor registrado).
+    """
+    loop = asyncio.get_event_loop()
+    leitor = asyncio.StreamReader(limit=limite_leitura, loop=loop)
+    protocolo = asyncio.StreamReaderProtocol(leitor, loop=loop)
+    transporte = TransporteConexao(conexao, protocolo, limite_escrita)
+    return leitor, asyncio.StreamWriter(transporte, protocolo, leitor, loop)
+
+
+def servir(servidor, tratador, limite_leitura=LIMITE_LEITURA, limite_escrita=LIMITE_ESCRITA):
+    """
+    Como asyncio.start_server: para cada conexão aceita pelo servidor, chama
+    tratador(leitor, escritor), que pode ser uma corrotina (nesse caso,
+    executada em uma task própria).
+    """
+    def conexao_aceita(conexao):
+        loop = asyncio.get_event_loop()
+        leitor = asyncio.StreamReader(limit=limite_leitura, loop=loop)
+        protocolo = asyncio.StreamReaderProtocol(leitor, tratador, loop=loop)
+        TransporteConexao(conexao, protocolo, limite_escrita)
+    servidor.registrar_monitor_de_conexoes_aceitas(conexao_aceita)
+
+
+async def abrir_conexao(cliente, dest_addr, dest_port,
+                        limite_leitura=LIMITE_LEITURA, limite_escrita=LIMITE_ESCRITA):
+    """
+    Como asyncio.open_connection: abre uma conexão com um tcp.Cliente e
+    retorna o par (StreamReader, StreamWriter) ligado a ela.
+    """
+    conexao = await cliente.conectar(dest_addr, dest_port)
+    return abrir_fluxos(conexao, limite_leitura, limite_escrita)
@@ -1,103 +1,258 @@
 #from grader.tcputils import calc_checksum, str2addr
 from iputils import *
+from checksum import calc_checksum
+from metricas import registro, limites_exponenciais
 import struct
 import random
+import bisect
 import socket
+from time import perf_counter
+from collections import OrderedDict
 
 ICMP_TYPE_TIME_EXCEEDED = 11
 ICMP_CODE_TTL_EXPIRED = 0
 
+# Tempo de cada busca de next_hop, em segundos, de 1 us a cerca de 1 s (com
+# o registro de métricas ativo)
+_latencia_busca = registro.histograma('ip.busca_rota', limites_exponenciais(1e-6, 2, 20))
+
+
+def _mascara(prefixo):
+    """
+    Máscara de rede de 32 bits correspondente a um comprimento de prefixo.
+    """
+    return (0xffffffff << (32 - prefixo)) & 0xffffffff
+
+
+def _atualizar_checksum(checksum, antigo, novo):
+    """
+    Atualiza incrementalmente um checksum complemento-de-um quando uma
+    palavra de 16 bits coberta por ele muda de antigo para novo, conforme a
+    equação 3 da RFC 1624: HC' = ~(~HC + ~m + m').
+    """
+    soma = (~checksum & 0xffff) + (~antigo & 0xffff) + novo
+    soma = (soma & 0xffff) + (soma >> 16)
+    soma = (soma & 0xffff) + (soma >> 16)
+    return ~soma & 0xffff
+
+
+def _ler_cidr(cidr):
+    """
+    Converte um CIDR 'x.y.z.w/n' em (n, rede), com a rede como inteiro de
+    32 bits e os bits além do prefixo zerados.
+    """
+    rede, prefixo = cidr.split('/')
+    prefixo = int(prefixo)
+    return prefixo, int.from_bytes(str2addr(rede), 'big') & _mascara(prefixo)
+
+
+class CacheRotas:
+    """
+    Cache LRU limitado de destino (inteiro de 32 bits) -> next_hop, usado
+    na frente da busca de prefixo mais longo. Com tamanho 0 fica desativado.
+    Os destinos guardados também ficam em uma lista ordenada, para que a
+    invalidação de um CIDR, que corresponde a um intervalo contíguo de
+    destinos, encontre só as entradas afetadas por busca binária.
+    """
+    AUSENTE = object()
+
+    def __init__(self, tamanho):
+        self.tamanho = tamanho
+        self.entradas = OrderedDict()
+        self.ordenados = []
+        self.acertos = 0
+        self.falhas = 0
+        self.remocoes = 0
+
+    def obter(self, dest):
+        """
+        Retorna o next_hop guardado para dest (que pode ser None, caso não
+        exista rota), ou CacheRotas.AUSENTE se dest não estiver no cache.
+        """
+        next_hop = self.entradas.get(dest, self.AUSENTE)
+        if next_hop is self.AUSENTE:
+            self.falhas += 1
+        else:
+            self.acertos += 1
+            self.entradas.move_to_end(dest)
+        return next_hop
+
+    def inserir(self, dest, next_hop):
+        if self.tamanho <= 0:
+            return
+        if dest not in self.entradas:
+            bisect.insort(self.ordenados, dest)
+        self.entradas[dest] = next_hop
+        if len(self.entradas) > self.tamanho:
+            antigo, _ = self.entradas.popitem(last=False)
+            del self.ordenados[bisect.bisect_left(self.ordenados, antigo)]
+            self.remocoes += 1
+
+    def limpar(self):
+        self.entradas.clear()
+        self.ordenados.clear()
+
+    def invalidar(self, prefixo, rede):
+        """
+        Remove os destinos contidos em rede/prefixo, que são os únicos cuja
+        rota pode mudar ao inserir ou remover esse CIDR da tabela. Custa
+        O(log n) mais a quantidade de entradas removidas.
+        """
+        ordenados = self.ordenados
+        inicio = bisect.bisect_left(ordenados, rede)
+        fim = bisect.bisect_left(ordenados, rede + (1 << (32 - prefixo)), inicio)
+        for dest in ordenados[inicio:fim]:
+            del self.entradas[dest]
+        del ordenados[inicio:fim]
+
+    def estatisticas(self):
+        return {'tamanho': self.tamanho, 'ocupacao': len(self.entradas),
+                'acertos': self.acertos, 'falhas': self.falhas,
+                'remocoes': self.remocoes}
+
+
 class IP:
-    def __init__(self, enlace):
+    def __init__(self, enlace, tamanho_cache_rotas=1024):
         """
         Inicia a camada de rede. Recebe como argumento uma implementação
         de camada de enlace capaz de localizar os next_hop (por exemplo,
-        Ethernet com ARP).
+        Ethernet com ARP). O argumento tamanho_cache_rotas limita quantos
+        destinos ficam guardados no cache de next_hop (0 desativa o cache).
         """
         self.callback = None
+        # Recebedores registrados por (protocolo, porta de destino), que têm
+        # precedência sobre o callback geral
+        self._recebedores = {}
         self.enlace = enlace
         self.enlace.registrar_recebedor(self.__raw_recv)
         self.ignore_checksum = self.enlace.ignore_checksum
         self.meu_endereco = None
-        self.tabela_encaminhamento = []
+        self._meu_endereco_bin = None
+        self._rotas = {}
+        self._rotas_por_prefixo = []
+        self.cache_rotas = CacheRotas(tamanho_cache_rotas)
+        # Contadores (vide estatisticas)
+        self.enviados = 0
+        self.entregues = 0
+        self.encaminhados = 0
+        self.descartados_ttl = 0
+        self.descartados_sem_rota = 0
+        self.descartados_sem_recebedor = 0
+        self.icmp_enviados = 0
 
     def __raw_recv(self, datagrama):
+        if datagrama[16:20] != self._meu_endereco_bin:
+            # Atua como roteador
+            self._encaminhar(datagrama)
+            return
+
+        # Atua como host. Escolhe o recebedor pela porta de destino, lida
+        # direto do datagrama (mesma posição no TCP e no UDP), antes de
+        # decodificar o cabeçalho
+        proto = datagrama[9]
+        ihl = (datagrama[0] & 0xf) * 4
+        callback = self._recebedores.get((proto, int.from_bytes(datagrama[ihl+2:ihl+4], 'big')))
+        if callback is None:
+            if proto != IPPROTO_TCP or self.callback is None:
+                self.descartados_sem_recebedor += 1
+                return
+            callback = self.callback
+        self.entregues += 1
         dscp, ecn, identification, flags, frag_offset, ttl, proto, \
         src_addr, dst_addr, payload = read_ipv4_header(datagrama)
-        
-        if dst_addr == self.meu_endereco:
-            # Atua como host
-            if proto == IPPROTO_TCP and self.callback:
-                self.callback(src_addr, dst_addr, payload)
-        else:
-            # Atua como roteador
-            if ttl <= 1: 
-                # Descartar o datagrama se o TTL for 0 ou 1
-                print("Datagrama descartado: TTL expirado.")
-                self._send_icmp_time_exceeded(src_addr, datagrama)
-                return None
-            else:
-                # Decrementa o TTL
-                ttl -= 1
-
-                # Converte os endereços IP para o formato de bytes
-                src_addr_bytes = str2addr(src_addr)
-                dst_addr_bytes = str2addr(dst_addr)
-
-                # Calcula o comprimento total do datagrama (cabeçalho + payload)
-                total_length = 20 + len(payload)
-
-                # Cabeçalho IP sem checksum
-                header = struct.pack('!BBHHHBBH4s4s',
-                                    (4 << 4) | 5, 0, total_length, identification,
-                                    0, ttl, proto, 0,
-                                    src_addr_bytes, dst_addr_bytes)
-
-                # Calcula o checksum do cabeçalho IP
-                checksum = calc_checksum(header)
-
-                # Cabeçalho com o checksum correto
-                header = struct.pack('!BBHHHBBH4s4s',
-                                    (4 << 4) | 5, 0, total_length, identification,
-                                    0, ttl, proto, checksum,
-                                    src_addr_bytes, dst_addr_bytes)
-
-                # Cria o novo datagrama com o cabeçalho atualizado
-                new_datagrama = header + payload
-
-                # Determina o próximo salto
-                next_hop = self._next_hop(dst_addr)
-
-                # Encaminha o datagrama para o próximo roteador
-                self.enlace.enviar(new_datagrama, next_hop)
+        callback(src_addr, dst_addr, payload)
+
+    def _encaminhar(self, datagrama):
+        """
+        Caminho rápido de encaminhamento. Lê apenas os campos necessários
+        diretamente dos bytes do cabeçalho, decrementa o TTL e corrige o
+        checksum de forma incremental (RFC 1624), sem remontar o cabeçalho
+        nem concatenar o payload de novo. Como o slip.Enlace entrega bytes,
+        que são imutáveis, ainda é feita uma cópia do datagrama inteiro
+        (payload incluído) por encaminhamento; evitá-la não compensaria,
+        já que o codificador SLIP precisa de um buffer contíguo e faz as
+        suas próprias cópias ao aplicar as sequências de escape.
+        """
+        ttl = datagrama[8]
+        if ttl <= 1:
+            # Descartar o datagrama se o TTL for 0 ou 1
+            self.descartados_ttl += 1
+            self._send_icmp_time_exceeded(addr2str(datagrama[12:16]), datagrama)
+            return
+
+        # Determina o próximo salto
+        next_hop = self._next_hop_int(int.from_bytes(datagrama[16:20], 'big'))
+        if next_hop is None:
+            self.descartados_sem_rota += 1
+            return
+
+        # Trabalha sobre um bytearray para alterar o cabeçalho no lugar. Essa
+        # é a única cópia do datagrama aqui (vide acima); se a camada de
+        # enlace já entregou um bytearray, nem ela é feita.
+        if not isinstance(datagrama, bytearray):
+            datagrama = bytearray(datagrama)
+        total_len = (datagrama[2] << 8) | datagrama[3]
+        if len(datagrama) > total_len:
+            del datagrama[total_len:]
+
+        # TTL e protocolo formam a palavra de 16 bits no deslocamento 8
+        proto = datagrama[9]
+        checksum = _atualizar_checksum((datagrama[10] << 8) | datagrama[11],
+                                       (ttl << 8) | proto, ((ttl - 1) << 8) | proto)
+        datagrama[8] = ttl - 1
+        datagrama[10] = checksum >> 8
+        datagrama[11] = checksum & 0xff
+
+        # Encaminha o datagrama para o próximo roteador
+        self.encaminhados += 1
+        self.enlace.enviar(datagrama, next_hop)
 
     def _next_hop(self, dest_addr):
-        # Converte o dest_addr para uma string de bits
-        dest_addr_bits = ''.join(f'{int(octeto):08b}' for octeto in dest_addr.split('.'))
-        
-        best_match = None
-        max_prefix_length = -1
-
-        # Itera sobre a tabela de encaminhamento
-        for cidr, next_hop in self.tabela_encaminhamento:
-            # Separa a parte da rede e a máscara do CIDR
-            rede, prefixo = cidr.split('/')
-            prefixo = int(prefixo)
-            
-            # Converte a rede para bits
-            rede_bits = ''.join(f'{int(octeto):08b}' for octeto in rede.split('.'))
-            
-            # Compara os primeiros `prefixo` bits
-            if rede_bits[:prefixo] == dest_addr_bits[:prefixo]:
-                # Verifica se o prefixo é o mais longo encontrado até agora
-                if prefixo > max_prefix_length:
-                    max_prefix_length = prefixo
-                    best_match = next_hop
-
-        return best_match
-
-
-       
+        """
+        Retorna o next_hop para dest_addr (string no formato x.y.z.w), ou None
+        caso nenhuma rota da tabela de encaminhamento case com o destino.
+        """
+        return self._next_hop_int(int.from_bytes(str2addr(dest_addr), 'big'))
+
+    def _next_hop_int(self, dest):
+        """
+        Como _next_hop, mas recebe o destino já convertido em inteiro de 32
+        bits. Consulta primeiro o cache de rotas.
+        """
+        medir = registro.ativo
+        if medir:
+            inicio = perf_counter()
+        next_hop = self.cache_rotas.obter(dest)
+        if next_hop is CacheRotas.AUSENTE:
+            next_hop = self._buscar_prefixo_mais_longo(dest)
+            self.cache_rotas.inserir(dest, next_hop)
+        if medir:
+            _latencia_busca.registrar(perf_counter() - inicio)
+        return next_hop
+
+    def _buscar_prefixo_mais_longo(self, dest):
+        """
+        Busca do prefixo mais longo para um destino inteiro. Percorre apenas
+        os comprimentos de prefixo presentes na tabela, do mais longo para o
+        mais curto, com uma consulta a dicionário em cada um.
+        """
+        for prefixo, mascara, rotas in self._rotas_por_prefixo:
+            next_hop = rotas.get(dest & mascara)
+            if next_hop is not None:
+                return next_hop
+        return None
+
+    def _atualizar_prefixos(self):
+        """
+        Reconstrói a lista (prefixo, mascara, {rede: next_hop}) usada pela
+        busca, ordenada do prefixo mais longo para o mais curto. Os
+        dicionários são compartilhados com self._rotas, então isso só é
+        necessário quando um comprimento de prefixo aparece ou desaparece
+        da tabela. A lista nova é montada à parte e trocada de uma vez, de
+        forma que uma busca nunca enxerga uma lista pela metade.
+        """
+        self._rotas_por_prefixo = [(prefixo, _mascara(prefixo), self._rotas[prefixo])
+                                   for prefixo in sorted(self._rotas, reverse=True)]
 
     def definir_endereco_host(self, meu_endereco):
         """
@@ -106,6 +261,7 @@ class IP:
         atuaremos como roteador em vez de atuar como host.
         """
         self.meu_endereco = meu_endereco
+        self._meu_endereco_bin = str2addr(meu_endereco)
 
     def definir_tabela_encaminhamento(self, tabela):
         """
@@ -115,10 +271,75 @@ class IP:
         Onde os CIDR são fornecidos no formato 'x.y.z.w/n', e os
         next_hop são fornecidos no formato 'x.y.z.w'.
         """
-        self.tabela_encaminhamento = tabela
-        # TODO: Guarde a tabela de encaminhamento. Se julgar conveniente,
-        # converta-a em uma estrutura de dados mais eficiente.
-        pass
+        rotas = {}
+        for cidr, next_hop in tabela:
+            prefixo, rede = _ler_cidr(cidr)
+            # Em caso de CIDR repetido, vale a primeira entrada da tabela
+            rotas.setdefault(prefixo, {}).setdefault(rede, next_hop)
+        self._rotas = rotas
+        self._atualizar_prefixos()
+        self.cache_rotas.limpar()
+
+    def adicionar_rota(self, cidr, next_hop):
+        """
+        Adiciona uma rota (ou substitui o next_hop de uma rota já existente
+        para o mesmo CIDR) sem reconstruir a tabela inteira.
+        """
+        prefixo, rede = _ler_cidr(cidr)
+        rotas = self._rotas.get(prefixo)
+        if rotas is None:
+            self._rotas[prefixo] = {rede: next_hop}
+            self._atualizar_prefixos()
+        else:
+            rotas[rede] = next_hop
+        self.cache_rotas.invalidar(prefixo, rede)
+
+    def remover_rota(self, cidr):
+        """
+        Remove a rota para o CIDR fornecido. Retorna o next_hop que estava
+        associado a ela, ou None se a rota não existia.
+        """
+        prefixo, rede = _ler_cidr(cidr)
+        rotas = self._rotas.get(prefixo)
+        if rotas is None or rede not in rotas:
+            return None
+        next_hop = rotas.pop(rede)
+        if not rotas:
+            del self._rotas[prefixo]
+            self._atualizar_prefixos()
+        self.cache_rotas.invalidar(prefixo, rede)
+        return next_hop
+
+    def obter_tabela_encaminhamento(self):
+        """
+        Retorna a tabela de encaminhamento atual no mesmo formato aceito por
+        definir_tabela_encaminhamento, do prefixo mais longo para o mais curto.
+        """
+        return [('%s/%d' % (addr2str(rede.to_bytes(4, 'big')), prefixo), next_hop)
+                for prefixo, _, rotas in self._rotas_por_prefixo
+                for rede, next_hop in rotas.items()]
+
+    def estatisticas_cache_rotas(self):
+        """
+        Retorna um dicionário com tamanho, ocupação e contadores de acertos,
+        falhas e remoções por falta de espaço do cache de rotas.
+        """
+        return self.cache_rotas.estatisticas()
+
+    def estatisticas(self):
+        """
+        Retorna um dicionário com os contadores de datagramas enviados por
+        este host, entregues a ele, encaminhados e descartados (por TTL
+        expirado, por falta de rota ou por falta de recebedor), mensagens
+        ICMP enviadas e as estatísticas do cache de rotas.
+        """
+        return {'enviados': self.enviados, 'entregues': self.entregues,
+                'encaminhados': self.encaminhados,
+                'descartados_ttl': self.descartados_ttl,
+                'descartados_sem_rota': self.descartados_sem_rota,
+                'descartados_sem_recebedor': self.descartados_sem_recebedor,
+                'icmp_enviados': self.icmp_enviados,
+                'cache_rotas': self.cache_rotas.estatisticas()}
 
     def registrar_recebedor(self, callback):
         """
@@ -126,6 +347,34 @@ class IP:
         """
         self.callback = callback
 
+    def registrar_porta(self, proto, porta, callback):
+        """
+        Registra uma função para receber apenas os segmentos do protocolo
+        proto (por exemplo, IPPROTO_TCP) destinados à porta dada. Várias
+        portas podem ser registradas ao mesmo tempo; segmentos para portas
+        não registradas vão para o callback de registrar_recebedor. Levanta
+        OSError se a porta já estiver registrada para outra função.
+        """
+        atual = self._recebedores.get((proto, porta))
+        if atual is not None and atual != callback:
+            raise OSError('porta %d já está em uso' % porta)
+        self._recebedores[(proto, porta)] = callback
+
+    def porta_registrada(self, proto, porta):
+        """
+        Indica se já há uma função registrada para a porta dada.
+        """
+        return (proto, porta) in self._recebedores
+
+    def remover_porta(self, proto, porta, callback=None):
+        """
+        Remove o registro de uma porta. Se callback for fornecido, só remove
+        se a porta estiver registrada para essa função, de forma que um dono
+        antigo nunca desfaz o registro de outro.
+        """
+        if callback is None or self._recebedores.get((proto, porta)) == callback:
+            self._recebedores.pop((proto, porta), None)
+
     def enviar(self, segmento, dest_addr, proto=IPPROTO_TCP):
         """
         Envia segmento para dest_addr, onde dest_addr é um endereço IPv4
@@ -174,8 +423,12 @@ class IP:
         
         # Encontrar o próximo salto
         next_hop = self._next_hop(dest_addr)
+        if next_hop is None:
+            self.descartados_sem_rota += 1
+            return
         
         # Enviar datagrama pela camada de enlace
+        self.enviados += 1
         self.enlace.enviar(datagrama, next_hop)
     
     def _send_icmp_time_exceeded(self, src_addr, original_datagrama):
@@ -217,4 +470,8 @@ class IP:
 
         # Envia o datagrama ICMP de volta ao remetente
         next_hop = self._next_hop(src_addr)
+        if next_hop is None:
+            self.descartados_sem_rota += 1
+            return
+        self.icmp_enviados += 1
         self.enlace.enviar(icmp_datagrama, next_hop)
\ No newline at end of file
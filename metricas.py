@@ -0,0 +1,169 @@
+# Registro de métricas da pilha, para achar gargalos nas placas sob carga.
+#
+# Os contadores ficam nos próprios objetos de cada camada, como inteiros
+# comuns (por exemplo, IP.encaminhados ou Enlace.quadros_recebidos), e cada
+# um expõe um método estatisticas(). Somar 1 a um atributo custa o mesmo que
+# testar se as métricas estão ativas, então eles são sempre contados. Já os
+# histogramas (latência da busca de rotas, RTT, cwnd...) só registram
+# amostras com o registro ativo; desativado, o custo é o de um teste.
+#
+# Uso típico, em um dos scripts das placas:
+#
+#     from metricas import registro
+#     registro.registrar('ip', rede)
+#     registro.registrar('slip', enlace)
+#     registro.ativar()
+#     registro.despejar_periodicamente(10)
+#
+# registro.instantaneo() retorna todas as métricas em um dicionário plano,
+# com nomes como 'ip.encaminhados' ou 'tcp.rtt.p99'.
+
+import asyncio
+import bisect
+import weakref
+
+
+def limites_exponenciais(inicio, fator, quantidade):
+    """
+    Limites superiores dos baldes de um histograma: inicio, inicio*fator,
+    inicio*fator**2, ... (quantidade valores).
+    """
+    return [inicio * fator**i for i in range(quantidade)]
+
+
+class Histograma:
+    """
+    Histograma com baldes de limites fixos. O balde i conta as amostras
+    menores ou iguais a limites[i] (e maiores que limites[i-1]); um último
+    balde conta as que passam do maior limite. Registrar uma amostra custa
+    uma busca binária nos limites.
+    """
+    __slots__ = ('limites', 'contagens', 'n', 'soma', 'minimo', 'maximo')
+
+    def __init__(self, limites):
+        self.limites = list(limites)
+        self.zerar()
+
+    def zerar(self):
+        self.contagens = [0] * (len(self.limites) + 1)
+        self.n = 0
+        self.soma = 0
+        self.minimo = None
+        self.maximo = None
+
+    def registrar(self, valor):
+        self.contagens[bisect.bisect_left(self.limites, valor)] += 1
+        self.n += 1
+        self.soma += valor
+        if self.minimo is None or valor < self.minimo:
+            self.minimo = valor
+        if self.maximo is None or valor > self.maximo:
+            self.maximo = valor
+
+    def percentil(self, p):
+        """
+        Estimativa do percentil p (de 0 a 100): o limite superior do balde
+        em que ele cai, ou o máximo, se cair no último balde.
+        """
+        if not self.n:
+            return None
+        alvo = p / 100 * self.n
+        acumulado = 0
+        for i, contagem in enumerate(self.contagens):
+            acumulado += contagem
+            if acumulado >= alvo and contagem:
+                return min(self.limites[i], self.maximo) if i < len(self.limites) else self.maximo
+        return self.maximo
+
+    def estatisticas(self):
+        return {'n': self.n, 'media': self.soma / self.n if self.n else None,
+                'min': self.minimo, 'max': self.maximo, 'p50': self.percentil(50),
+                'p90': self.percentil(90), 'p99': self.percentil(99)}
+
+
+class Registro:
+    """
+    Reúne as métricas da pilha: as fontes registradas (objetos com um
+    método estatisticas(), guardados por referência fraca, de forma que o
+    registro não os mantém vivos) e os histogramas.
+    """
+    def __init__(self):
+        self.ativo = False
+        self.fontes = {}        # nome -> weakref para a fonte
+        self.histogramas = {}   # nome -> Histograma
+
+    def ativar(self):
+        self.ativo = True
+
+    def desativar(self):
+        self.ativo = False
+
+    def registrar(self, nome, fonte):
+        """
+        Registra uma fonte de métricas, que aparece em instantaneo() com o
+        nome como prefixo. Um nome já usado é substituído.
+        """
+        self.fontes[nome] = weakref.ref(fonte)
+
+    def histograma(self, nome, limites):
+        """
+        Retorna o histograma com esse nome, criando-o se ainda não existir.
+        """
+        histograma = self.histogramas.get(nome)
+        if histograma is None:
+            histograma = self.histogramas[nome] = Histograma(limites)
+        return histograma
+
+    def zerar_histogramas(self):
+        for histograma in self.histogramas.values():
+            histograma.zerar()
+
+    def instantaneo(self):
+        """
+        Retorna um dicionário {nome: valor} com as métricas atuais de todas
+        as fontes e dos histogramas que já têm amostras.
+        """
+        resultado = {}
+        for nome, ref in list(self.fontes.items()):
+            fonte = ref()
+            if fonte is None:
+                del self.fontes[nome]
+            else:
+                _achatar(resultado, nome, fonte.estatisticas())
+        for nome, histograma in self.histogramas.items():
+            if histograma.n:
+                _achatar(resultado, nome, histograma.estatisticas())
+        return resultado
+
+    def despejar(self, saida=print):
+        """
+        Escreve as métricas atuais, uma por linha, em ordem alfabética.
+        """
+        for nome, valor in sorted(self.instantaneo().items()):
+            if isinstance(valor, float):
+                valor = '%.6g' % valor
+            saida('%s %s' % (nome, valor))
+
+    def despejar_periodicamente(self, intervalo, saida=print):
+        """
+        Chama despejar a cada intervalo segundos. Retorna a Task que faz
+        isso, que pode ser cancelada.
+        """
+        async def despejar():
+            while True:
+                await asyncio.sleep(intervalo)
+                self.despejar(saida)
+        return asyncio.ensure_future(despejar())
+
+
+def _achatar(resultado, prefixo, valores):
+    for chave, valor in valores.items():
+        nome = '%s.%s' % (prefixo, chave)
+        if isinstance(valor, dict):
+            _achatar(resultado, nome, valor)
+        else:
+            resultado[nome] = valor
+
+
+# Registro usado pelas camadas da pilha
+registro = Registro()
@@ -3,6 +3,7 @@ import asyncio
 from camadafisica import ZyboSerialDriver
 from ip import IP               # copie o arquivo do T3
 from slip import CamadaEnlace   # copie o arquivo do T4
+from metricas import registro
 
 
 driver = ZyboSerialDriver()
@@ -20,4 +21,11 @@ rede.definir_tabela_encaminhamento([
     ('192.168.200.4/32', '192.168.200.4'),
 ])
 
+# Métricas de cada camada (vide metricas.py). Para escrevê-las no terminal a
+# cada 10 s, com os histogramas, descomente a última linha.
+registro.registrar('zybo', driver)
+registro.registrar('slip', enlace)
+registro.registrar('ip', rede)
+#registro.ativar(); registro.despejar_periodicamente(10)
+
 asyncio.get_event_loop().run_forever()
@@ -4,6 +4,7 @@ from camadafisica import ZyboSerialDriver
 from tcp import Servidor        # copie o arquivo do T2
 from ip import IP               # copie o arquivo do T3
 from slip import CamadaEnlace   # copie o arquivo do T4
+from metricas import registro
 
 ## Implementação da camada de aplicação
 
@@ -37,4 +38,15 @@ rede.definir_tabela_encaminhamento([
 ])
 servidor = Servidor(rede, porta_tcp)
 servidor.registrar_monitor_de_conexoes_aceitas(conexao_aceita)
+# Outros servidores (por exemplo, o de IRC) podem ser criados da mesma forma
+# sobre a mesma rede, cada um na sua porta
+
+# Métricas de cada camada (vide metricas.py). Para escrevê-las no terminal a
+# cada 10 s, com os histogramas, descomente a última linha.
+registro.registrar('zybo', driver)
+registro.registrar('slip', enlace)
+registro.registrar('ip', rede)
+registro.registrar('tcp', servidor)
+#registro.ativar(); registro.despejar_periodicamente(10)
+
 asyncio.get_event_loop().run_forever()
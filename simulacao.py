@@ -0,0 +1,77 @@
+"""
+Simulação local da rede das três placas (vide placa1.py, placa2.py e
+placa3.py), com as linhas seriais substituídas por LinhaSerialSimulada e
+todos os nós executando no mesmo laço de eventos. O computador com Linux
+ligado à placa 1 é substituído por mais um nó com a nossa pilha.
+
+    host (192.168.200.1) --- placa1 (.2) --- placa2 (.3) --- placa3 (.4)
+                                                            servidor de eco
+                                                            na porta 7000
+"""
+from types import SimpleNamespace
+from camadafisica import LinhaSerialSimulada
+from tcp import Servidor
+from ip import IP
+from slip import CamadaEnlace
+
+
+PORTA_ECO = 7000
+
+
+def dados_recebidos(conexao, dados):
+    if dados == b'':
+        conexao.fechar()
+    else:
+        conexao.enviar(dados)   # envia de volta
+
+
+def conexao_aceita(conexao):
+    conexao.registrar_recebedor(dados_recebidos)
+
+
+def montar_topologia(**parametros_linha):
+    """
+    Monta a topologia das placas. Os argumentos são repassados para
+    LinhaSerialSimulada.par (baud, latencia, perda, corrupcao, rng) e valem
+    para todas as linhas. Retorna um objeto com os atributos host, placa1,
+    placa2 e placa3 (as camadas IP de cada nó), servidor (o Servidor TCP de
+    eco da placa 3) e linhas (todas as pontas de linha serial criadas).
+    """
+    host_p1, p1_host = LinhaSerialSimulada.par(**parametros_linha)
+    p1_p2, p2_p1 = LinhaSerialSimulada.par(**parametros_linha)
+    p2_p3, p3_p2 = LinhaSerialSimulada.par(**parametros_linha)
+
+    host = IP(CamadaEnlace({'192.168.200.2': host_p1}))
+    host.definir_endereco_host('192.168.200.1')
+    host.definir_tabela_encaminhamento([
+        ('0.0.0.0/0', '192.168.200.2'),
+    ])
+
+    placa1 = IP(CamadaEnlace({'192.168.200.1': p1_host,
+                              '192.168.200.3': p1_p2}))
+    placa1.definir_endereco_host('192.168.200.2')
+    placa1.definir_tabela_encaminhamento([
+        ('192.168.200.1/32', '192.168.200.1'),
+        ('192.168.200.0/24', '192.168.200.3'),
+    ])
+
+    placa2 = IP(CamadaEnlace({'192.168.200.4': p2_p3,
+                              '192.168.200.2': p2_p1}))
+    placa2.definir_endereco_host('192.168.200.3')
+    placa2.definir_tabela_encaminhamento([
+        ('192.168.200.0/24', '192.168.200.2'),
+        ('192.168.200.4/32', '192.168.200.4'),
+    ])
+
+    placa3 = IP(CamadaEnlace({'192.168.200.3': p3_p2}))
+    placa3.definir_endereco_host('192.168.200.4')
+    placa3.definir_tabela_encaminhamento([
+        ('0.0.0.0/0', '192.168.200.3'),
+    ])
+    servidor = Servidor(placa3, PORTA_ECO)
+    servidor.registrar_monitor_de_conexoes_aceitas(conexao_aceita)
+
+    return SimpleNamespace(host=host, placa1=placa1, placa2=placa2, placa3=placa3,
+                           servidor=servidor,
+                           linhas=[host_p1, p1_host, p1_p2, p2_p1, p2_p3, p3_p2])
+
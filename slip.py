@@ -1,3 +1,16 @@
+# Constantes SLIP
+SLIP_END = 0xC0
+SLIP_ESC = 0xDB
+SLIP_ESC_END = 0xDC
+SLIP_ESC_ESC = 0xDD
+
+# Sequências de bytes correspondentes, usadas pelo codificador
+_END = bytes([SLIP_END])
+_ESC = bytes([SLIP_ESC])
+_ESC_END = bytes([SLIP_ESC, SLIP_ESC_END])
+_ESC_ESC = bytes([SLIP_ESC, SLIP_ESC_ESC])
+
+
 class CamadaEnlace:
     ignore_checksum = False
 
@@ -34,6 +47,13 @@ class CamadaEnlace:
         # Encontra o Enlace capaz de alcançar next_hop e envia por ele
         self.enlaces[next_hop].enviar(datagrama)
 
+    def estatisticas(self):
+        """
+        Retorna as estatísticas de cada Enlace, pelo IP da outra ponta.
+        """
+        return {ip_outra_ponta: enlace.estatisticas()
+                for ip_outra_ponta, enlace in self.enlaces.items()}
+
     def _callback(self, datagrama):
         if self.callback:
             self.callback(datagrama)
@@ -42,82 +62,110 @@ class Enlace:
     def __init__(self, linha_serial):
         self.linha_serial = linha_serial
         self.linha_serial.registrar_recebedor(self.__raw_recv)
-        
-        #Atributos criados
-        self.escaped = []
-        self.buffer = []
+
+        # Pedaço do quadro em andamento, ainda com as sequências de escape
+        self.buffer = bytearray()
+
+        # Contadores (vide estatisticas). Os bytes incluem os SLIP_END e as
+        # sequências de escape; cada sequência conta como um escape.
+        self.quadros_enviados = 0
+        self.bytes_enviados = 0
+        self.escapes_enviados = 0
+        self.quadros_recebidos = 0
+        self.bytes_recebidos = 0
+        self.escapes_recebidos = 0
+        self.quadros_vazios = 0
+        self.erros_recebedor = 0
 
     def registrar_recebedor(self, callback):
         self.callback = callback
 
     def enviar(self, datagrama):
-        # Constantes SLIP
-        SLIP_END = 0xC0
-        SLIP_ESC = 0xDB
-        SLIP_ESC_END = 0xDC
-        SLIP_ESC_ESC = 0xDD
-
-        # Adiciona o byte delimitador no início
-        quadro = bytes([SLIP_END])
-
-        # Processa o datagrama para aplicar as sequências de escape
-        for byte in datagrama:
-            if byte == SLIP_END:
-                # Substitui 0xC0 por 0xDB 0xDC
-                quadro += bytes([SLIP_ESC, SLIP_ESC_END])
-            elif byte == SLIP_ESC:
-                # Substitui 0xDB por 0xDB 0xDD
-                quadro += bytes([SLIP_ESC, SLIP_ESC_ESC])
-            else:
-                # Caso contrário, insere o byte original
-                quadro += bytes([byte])
-
-        # Adiciona o byte delimitador no final
-        quadro += bytes([SLIP_END])
+        # Aplica as sequências de escape com duas substituições feitas em C.
+        # O SLIP_ESC precisa ser escapado primeiro, senão os SLIP_ESC
+        # inseridos ao escapar o SLIP_END seriam escapados de novo.
+        corpo = datagrama.replace(_ESC, _ESC_ESC).replace(_END, _ESC_END)
+
+        # Delimita o quadro com SLIP_END no início e no final
+        quadro = b''.join((_END, corpo, _END))
+        self.quadros_enviados += 1
+        self.bytes_enviados += len(quadro)
+        self.escapes_enviados += len(corpo) - len(datagrama)
 
         # Envia o quadro pela linha serial
         self.linha_serial.enviar(quadro)
+
     def __raw_recv(self, dados):
-        # TODO: Preencha aqui com o código para receber dados da linha serial.
-        # Trate corretamente as sequências de escape. Quando ler um quadro
-        # completo, repasse o datagrama contido nesse quadro para a camada
-        # superior chamando self.callback. Cuidado pois o argumento dados pode
-        # vir quebrado de várias formas diferentes - por exemplo, podem vir
-        # apenas pedaços de um quadro, ou um pedaço de quadro seguido de um
-        # pedaço de outro, ou vários quadros de uma vez só.
-        pass
-    # Constantes SLIP
-        SLIP_END = 0xC0
-        SLIP_ESC = 0xDB
-        SLIP_ESC_END = 0xDC
-        SLIP_ESC_ESC = 0xDD
-
-        for byte in dados:
-            if byte == SLIP_END:
-                # Verifica se o buffer contém um datagrama completo
-                if self.buffer:
-                    try:
-                        # Repassa o datagrama completo para a camada superior, se não estiver vazio
-                        if len(self.buffer) > 0:
-                            self.callback(bytes(self.buffer))
-                    except:
-                        import traceback
-                        traceback.print_exc()
-                    finally:   
-                        # Limpa o buffer para o próximo quadro
-                        self.buffer.clear()
+        # Os dados podem vir quebrados de várias formas diferentes: pedaços
+        # de um quadro, um pedaço de quadro seguido de um pedaço de outro, ou
+        # vários quadros de uma vez. Separando pelos SLIP_END, o primeiro
+        # pedaço continua o quadro em andamento (guardado em self.buffer) e o
+        # último começa o próximo; os do meio são quadros completos.
+        self.bytes_recebidos += len(dados)
+        partes = dados.split(_END)
+        if len(partes) == 1:
+            self.buffer += dados
+            return
+
+        if self.buffer:
+            self.buffer += partes[0]
+            partes[0] = bytes(self.buffer)
+        self.buffer = bytearray(partes.pop())
+
+        for quadro in partes:
+            # Ignora quadros vazios (SLIP_END consecutivos)
+            if not quadro:
                 continue
+            datagrama = _desescapar(quadro)
+            if not datagrama:
+                self.quadros_vazios += 1
+                continue
+            self.quadros_recebidos += 1
+            self.escapes_recebidos += len(quadro) - len(datagrama)
+            try:
+                self.callback(datagrama)
+            except:
+                self.erros_recebedor += 1
+                import traceback
+                traceback.print_exc()
+
+    def estatisticas(self):
+        return {'quadros_enviados': self.quadros_enviados,
+                'bytes_enviados': self.bytes_enviados,
+                'escapes_enviados': self.escapes_enviados,
+                'quadros_recebidos': self.quadros_recebidos,
+                'bytes_recebidos': self.bytes_recebidos,
+                'escapes_recebidos': self.escapes_recebidos,
+                'quadros_vazios': self.quadros_vazios,
+                'erros_recebedor': self.erros_recebedor}
+
 
-            if self.escaped:
-                # Trata a sequência de escape
-                if byte == SLIP_ESC_END:
-                    self.buffer.append(SLIP_END)
-                elif byte == SLIP_ESC_ESC:
-                    self.buffer.append(SLIP_ESC)
-                self.escaped = False
-            elif byte == SLIP_ESC:
-                # Indica que o próximo byte é parte de uma sequência de escape
-                self.escaped = True
-            else:
-                # Byte normal, adiciona ao buffer
-                self.buffer.append(byte)
+def _desescapar(quadro):
+    """
+    Desfaz as sequências de escape de um quadro SLIP (sem os SLIP_END).
+    """
+    if SLIP_ESC not in quadro:
+        return quadro
+    # Num quadro bem formado, todo SLIP_ESC inicia uma das duas sequências de
+    # escape, e basta substituí-las (SLIP_ESC_END primeiro, pois a troca de
+    # SLIP_ESC SLIP_ESC_ESC por SLIP_ESC poderia formar um novo SLIP_ESC_END).
+    n_esc_end = quadro.count(_ESC_END)
+    n_esc_esc = quadro.count(_ESC_ESC)
+    if quadro.count(_ESC) == n_esc_end + n_esc_esc:
+        return quadro.replace(_ESC_END, _END).replace(_ESC_ESC, _ESC)
+    # Quadro com escape inválido: trata byte a byte, descartando o SLIP_ESC
+    # e o byte seguinte quando eles não formam uma sequência conhecida.
+    datagrama = bytearray()
+    escaped = False
+    for byte in quadro:
+        if escaped:
+            if byte == SLIP_ESC_END:
+                datagrama.append(SLIP_END)
+            elif byte == SLIP_ESC_ESC:
+                datagrama.append(SLIP_ESC)
+            escaped = False
+        elif byte == SLIP_ESC:
+            escaped = True
+        else:
+            datagrama.append(byte)
+    return bytes(datagrama)
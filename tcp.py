@@ -1,16 +1,398 @@
 import asyncio
+import bisect
+import random
+import hashlib
+import secrets
 from time import time
+from collections import deque, OrderedDict
 #from grader.tcputils import FLAGS_ACK, FLAGS_FIN, FLAGS_SYN, MSS, fix_checksum, make_header
 from tcputils import *
+from congestionamento import Reno
+from metricas import registro, limites_exponenciais
+from iputils import IPPROTO_TCP
+from checksum import calc_checksum, fix_checksum
+import struct
 
+# Capacidade padrão do buffer de recepção de cada conexão, que limita a
+# janela anunciada (o mesmo valor que o make_header do tcputils anuncia)
+TAMANHO_BUFFER_RECEPCAO = 8*MSS
 
-class Servidor:
-    def __init__(self, rede, porta):
+# Estados de uma Conexao (RFC 793, 3.2). As conexões só são criadas depois
+# do handshake, então os estados anteriores a ESTABLISHED não aparecem.
+ESTABLISHED = 'ESTABLISHED'
+FIN_WAIT_1 = 'FIN_WAIT_1'
+FIN_WAIT_2 = 'FIN_WAIT_2'
+CLOSING = 'CLOSING'
+TIME_WAIT = 'TIME_WAIT'
+CLOSE_WAIT = 'CLOSE_WAIT'
+LAST_ACK = 'LAST_ACK'
+CLOSED = 'CLOSED'
+
+# Tempo em TIME_WAIT (2*MSL, com MSL de 30 s como no Linux) e quantidade
+# máxima de conexões guardadas nesse estado por Servidor ou Cliente
+DURACAO_TIME_WAIT = 60
+MAXIMO_TIME_WAIT = 4096
+
+# Quantidade padrão de conexões semiabertas guardadas por um Servidor antes
+# de passar a responder com SYN cookies (como o backlog do listen)
+BACKLOG_SYN = 128
+# Período do contador de tempo dos SYN cookies, em segundos. Um cookie vale
+# até dois períodos depois de enviado.
+PERIODO_COOKIE = 64
+
+# Histogramas das conexões (com o registro de métricas ativo): amostras de
+# RTT em segundos, e cwnd em bytes e segmentos na fila de envio a cada ACK novo
+_hist_rtt = registro.histograma('tcp.rtt', limites_exponenciais(0.001, 2, 17))
+_hist_cwnd = registro.histograma('tcp.cwnd', limites_exponenciais(MSS, 2, 10))
+_hist_fila_envio = registro.histograma('tcp.fila_envio', limites_exponenciais(1, 2, 10))
+
+
+def montar_cabecalho(src_port, dst_port, seq_no, ack_no, flags, janela):
+    """
+    Como o make_header do tcputils, mas anunciando a janela de recepção
+    fornecida em vez de um valor fixo. Os números de sequência são reduzidos
+    a 32 bits.
+    """
+    return struct.pack('!HHIIHHHH',
+                       src_port, dst_port, seq_no & 0xffffffff, ack_no & 0xffffffff,
+                       (5 << 12) | flags, min(janela, 0xffff), 0, 0)
+
+
+def _desdobrar(numero, referencia):
+    """
+    Converte um número de sequência de 32 bits lido do cabeçalho no inteiro
+    (sem limite) mais próximo de referencia com os mesmos 32 bits menos
+    significativos. As conexões guardam os números de sequência assim, a
+    partir do ISN, para que as comparações continuem valendo quando os
+    números do cabeçalho dão a volta.
+    """
+    return referencia + ((numero - referencia + 2**31) & 0xffffffff) - 2**31
+
+
+def _gerar_isn():
+    # Com um gerador criptográfico, como nos SYN cookies, para que os ISNs
+    # não possam ser previstos a partir dos anteriores
+    return secrets.randbits(32)
+
+
+class Temporizador:
+    """
+    Timer reutilizável de uma RodaDeTimers. Armar de novo um timer já armado
+    apenas o muda de posição na roda, sem alocar nada.
+    """
+    __slots__ = ('roda', 'callback', 'expira', 'balde')
+
+    def __init__(self, roda, callback):
+        self.roda = roda
+        self.callback = callback
+        self.expira = None  # tick em que o timer dispara
+        self.balde = None   # balde da roda em que está, se estiver armado
+
+    @property
+    def ativo(self):
+        return self.balde is not None
+
+    def armar(self, atraso):
+        """
+        (Re)arma o timer para disparar daqui a atraso segundos.
+        """
+        self.roda._armar(self, atraso)
+
+    def cancelar(self):
+        self.roda._cancelar(self)
+
+
+class RodaDeTimers:
+    """
+    Roda de timers com hashing (Varghese & Lauck): os timers ficam em baldes
+    indexados pelo tick em que expiram, módulo a quantidade de baldes, e um
+    único callback periódico do laço de eventos, agendado apenas enquanto
+    houver timers armados, dispara os que venceram a cada tick. Armar e
+    cancelar custam O(1), em vez de um TimerHandle novo no heap do laço de
+    eventos a cada chamada de call_later.
+    """
+    def __init__(self, resolucao=0.01, baldes=512):
+        self.resolucao = resolucao
+        self.baldes = [{} for _ in range(baldes)]
+        self.armados = 0
+        self.tick_processado = None  # último tick cujos timers já dispararam
+        self.handle = None
+
+    def criar(self, callback):
+        return Temporizador(self, callback)
+
+    def _tick_atual(self):
+        return int(asyncio.get_event_loop().time() / self.resolucao)
+
+    def _armar(self, temporizador, atraso):
+        if temporizador.balde is not None:
+            del temporizador.balde[temporizador]
+        else:
+            self.armados += 1
+        agora = self._tick_atual()
+        if self.handle is None:
+            # A roda estava parada (ou girando agora): nada a processar antes
+            self.tick_processado = agora
+        # Arredonda para cima: o timer nunca dispara antes do atraso pedido
+        expira = max(agora + 1 + int(atraso / self.resolucao), self.tick_processado + 1)
+        balde = self.baldes[expira % len(self.baldes)]
+        balde[temporizador] = None
+        temporizador.expira = expira
+        temporizador.balde = balde
+        if self.handle is None:
+            self._agendar()
+
+    def _cancelar(self, temporizador):
+        if temporizador.balde is not None:
+            del temporizador.balde[temporizador]
+            temporizador.balde = None
+            self.armados -= 1
+
+    def _agendar(self):
+        loop = asyncio.get_event_loop()
+        self.handle = loop.call_at((self.tick_processado + 1) * self.resolucao, self._girar)
+
+    def _girar(self):
+        self.handle = None
+        agora = self._tick_atual()
+        tick = self.tick_processado
+        # Com o laço atrasado, processa todos os ticks perdidos, mas no
+        # máximo uma volta completa (os baldes se repetem depois disso)
+        if agora - tick > len(self.baldes):
+            tick = agora - len(self.baldes)
+        while tick < agora and self.armados:
+            tick += 1
+            balde = self.baldes[tick % len(self.baldes)]
+            if not balde:
+                continue
+            vencidos = [t for t in balde if t.expira <= agora]
+            for temporizador in vencidos:
+                # Pode ter sido cancelado ou rearmado por um callback anterior
+                if temporizador.balde is balde and temporizador.expira <= agora:
+                    self._cancelar(temporizador)
+                    temporizador.callback()
+        self.tick_processado = agora
+        if self.armados and self.handle is None:
+            self._agendar()
+
+
+class TabelaTimeWait:
+    """
+    Conexões em TIME_WAIT. Em vez da Conexao inteira, guarda só os números
+    de sequência necessários para confirmar de novo um FIN retransmitido
+    pela outra ponta. Como todas ficam o mesmo tempo, a ordem de inserção é
+    a ordem de expiração, e as vencidas são removidas do início sempre que
+    a tabela é usada. Se ela chegar a `maximo` entradas, a mais antiga é
+    descartada antes do prazo (como faz o tcp_max_tw_buckets do Linux).
+    """
+    def __init__(self, duracao=DURACAO_TIME_WAIT, maximo=MAXIMO_TIME_WAIT, ao_remover=None):
+        self.duracao = duracao
+        self.maximo = maximo
+        # Função chamada com o id_conexao de cada entrada que sai da tabela
+        self.ao_remover = ao_remover
+        self.entradas = OrderedDict()   # id_conexao -> (expira, seq_no, ack_no)
+        self.descartadas = 0            # removidas antes do prazo
+
+    def __len__(self):
+        return len(self.entradas)
+
+    def inserir(self, id_conexao, seq_no, ack_no):
+        agora = time()
+        self.limpar(agora)
+        self.remover(id_conexao)
+        while len(self.entradas) >= self.maximo:
+            self._remover_primeira()
+            self.descartadas += 1
+        self.entradas[id_conexao] = (agora + self.duracao, seq_no, ack_no)
+
+    def remover(self, id_conexao):
+        if self.entradas.pop(id_conexao, None) is not None and self.ao_remover:
+            self.ao_remover(id_conexao)
+
+    def _remover_primeira(self):
+        id_conexao, _ = self.entradas.popitem(last=False)
+        if self.ao_remover:
+            self.ao_remover(id_conexao)
+
+    def limpar(self, agora=None):
+        """
+        Remove as entradas que já passaram do prazo.
+        """
+        if agora is None:
+            agora = time()
+        entradas = self.entradas
+        while entradas and next(iter(entradas.values()))[0] <= agora:
+            self._remover_primeira()
+
+    def tratar(self, rede, id_conexao, flags, seq_recebido):
+        """
+        Trata um segmento de uma conexão que pode estar em TIME_WAIT: se for
+        um FIN (a outra ponta não recebeu nosso último ACK), confirma de
+        novo; se for um RST com o número de sequência esperado, tira a
+        conexão da tabela. Retorna se a conexão estava na tabela.
+        """
+        self.limpar()
+        entrada = self.entradas.get(id_conexao)
+        if entrada is None:
+            return False
+        _, seq_no, ack_no = entrada
+        if (flags & FLAGS_RST) == FLAGS_RST:
+            if seq_recebido == ack_no & 0xffffffff:
+                self.remover(id_conexao)
+        elif (flags & FLAGS_FIN) == FLAGS_FIN:
+            src_addr, src_port, dst_addr, dst_port = id_conexao
+            segmento = fix_checksum(montar_cabecalho(dst_port, src_port, seq_no, ack_no, FLAGS_ACK, 0), src_addr, dst_addr)
+            rede.enviar(segmento, src_addr)
+        return True
+
+
+class SemiAberta:
+    """
+    Conexão semiaberta: SYN recebido e SYN-ACK enviado, aguardando o ACK
+    final. Guarda só o necessário para retransmitir o SYN-ACK e criar a
+    Conexao quando o handshake terminar.
+    """
+    __slots__ = ('isn', 'seq_remoto', 'tentativas', 'proximo_envio')
+
+    def __init__(self, isn, seq_remoto, proximo_envio):
+        self.isn = isn
+        self.seq_remoto = seq_remoto    # ISN da outra ponta
+        self.tentativas = 0
+        self.proximo_envio = proximo_envio
+
+
+class _PontaTCP:
+    """
+    Parte comum ao Servidor e ao Cliente: fornece às conexões a camada de
+    rede, a roda de timers e o controle de congestionamento, e guarda as
+    conexões abertas, a tabela de TIME_WAIT e os contadores.
+    """
+    def __init__(self, rede, controle_congestionamento):
         self.rede = rede
-        self.porta = porta
+        # Classe do algoritmo de controle de congestionamento (vide
+        # congestionamento.py), instanciada uma vez por conexão
+        self.controle_congestionamento = controle_congestionamento
+        # Timers de todas as conexões
+        self.timers = RodaDeTimers()
         self.conexoes = {}
+        self.time_wait = TabelaTimeWait(ao_remover=self._liberar_id)
+        # Contadores (vide estatisticas)
+        self.segmentos_recebidos = 0
+        self.checksum_incorreto = 0
+        self.encerradas = 0
+        self.resets_enviados = 0
+        self.retransmissoes = 0             # das conexões já encerradas
+        self.retransmissoes_espurias = 0    # idem
+
+    def _checksum_valido(self, src_addr, dst_addr, segment):
+        self.segmentos_recebidos += 1
+        if not self.rede.ignore_checksum and calc_checksum(segment, src_addr, dst_addr) != 0:
+            self.checksum_incorreto += 1
+            return False
+        return True
+
+    def _enviar_controle(self, id_conexao, seq_no, ack_no, flags, janela=TAMANHO_BUFFER_RECEPCAO):
+        """
+        Envia um segmento sem dados para a outra ponta de id_conexao, fora
+        de uma Conexao (SYN, SYN-ACK, RST).
+        """
+        src_addr, src_port, dst_addr, dst_port = id_conexao
+        segmento = fix_checksum(montar_cabecalho(dst_port, src_port, seq_no, ack_no, flags, janela), src_addr, dst_addr)
+        self.rede.enviar(segmento, src_addr)
+
+    def _enviar_rst(self, id_conexao, seq_no, ack_no=None):
+        """
+        Envia um RST com o número de sequência dado e, se ack_no for
+        fornecido, também com o ACK.
+        """
+        self.resets_enviados += 1
+        if ack_no is None:
+            self._enviar_controle(id_conexao, seq_no, 0, FLAGS_RST, 0)
+        else:
+            self._enviar_controle(id_conexao, seq_no, ack_no, FLAGS_RST | FLAGS_ACK, 0)
+
+    def _responder_rst(self, id_conexao, seq_no, ack_no, flags, payload):
+        """
+        Responde com RST a um segmento de uma conexão que não existe (RFC
+        9293, 3.10.7.1), para que a outra ponta a descarte em vez de
+        retransmitir até desistir. Se o segmento tem ACK, o RST usa o número
+        confirmado, que é o que a outra ponta espera; senão, confirma o
+        segmento. Um RST nunca é respondido.
+        """
+        if (flags & FLAGS_RST) == FLAGS_RST:
+            return
+        if (flags & FLAGS_ACK) == FLAGS_ACK:
+            self._enviar_rst(id_conexao, ack_no)
+        else:
+            tamanho = len(payload) + ((flags & FLAGS_SYN) == FLAGS_SYN) + ((flags & FLAGS_FIN) == FLAGS_FIN)
+            self._enviar_rst(id_conexao, 0, seq_no + tamanho)
+
+    def _estatisticas_conexoes(self):
+        """
+        Parte de estatisticas() comum ao Servidor e ao Cliente. As
+        retransmissões somam as das conexões abertas às das já encerradas.
+        """
+        retransmissoes, espurias = self.retransmissoes, self.retransmissoes_espurias
+        for conexao in self.conexoes.values():
+            retransmissoes += conexao.retransmissoes
+            espurias += conexao.retransmissoes_espurias
+        return {'conexoes': len(self.conexoes), 'time_wait': len(self.time_wait),
+                'segmentos_recebidos': self.segmentos_recebidos,
+                'checksum_incorreto': self.checksum_incorreto,
+                'encerradas': self.encerradas,
+                'resets_enviados': self.resets_enviados,
+                'retransmissoes': retransmissoes,
+                'retransmissoes_espurias': espurias}
+
+    def _conexao_encerrada(self, conexao):
+        """
+        Chamada pela conexão ao chegar em CLOSED ou TIME_WAIT.
+        """
+        if self.conexoes.get(conexao.id_conexao) is conexao:
+            del self.conexoes[conexao.id_conexao]
+        self.encerradas += 1
+        self.retransmissoes += conexao.retransmissoes
+        self.retransmissoes_espurias += conexao.retransmissoes_espurias
+        if conexao.estado == TIME_WAIT:
+            self.time_wait.inserir(conexao.id_conexao, conexao.seq_client, conexao.ack_no)
+        else:
+            self._liberar_id(conexao.id_conexao)
+
+    def _liberar_id(self, id_conexao):
+        """
+        Chamada quando uma conexão deixa de existir, ao ser encerrada ou ao
+        sair da tabela de TIME_WAIT.
+        """
+
+
+class Servidor(_PontaTCP):
+    # Quantas vezes o SYN-ACK de uma conexão semiaberta é retransmitido
+    # antes de desistir dela
+    TENTATIVAS_SYN_ACK = 5
+
+    def __init__(self, rede, porta, controle_congestionamento=Reno, backlog=BACKLOG_SYN):
+        super().__init__(rede, controle_congestionamento)
+        self.porta = porta
+        # Conexões semiabertas, sem Conexao alocada: a Conexao só é criada, e
+        # a aplicação avisada, quando chega o ACK final do handshake. Com
+        # backlog delas, os SYNs seguintes são respondidos com SYN cookies,
+        # de forma que uma rajada de SYNs não aumenta o estado guardado.
+        self.backlog = backlog
+        self.semiabertas = OrderedDict()    # id_conexao -> SemiAberta
+        self.timer_semiabertas = self.timers.criar(self._retransmitir_syn_acks)
+        self.segredo_cookies = secrets.token_bytes(16)
+        self.cookies_enviados = 0
+        self.cookies_aceitos = 0
+        self.desconhecidos = 0
+        self.aceitas = 0
         self.callback = None
-        self.rede.registrar_recebedor(self._rdt_rcv)
+        # Se a camada de rede separa os segmentos por porta (vide
+        # IP.registrar_porta), vários servidores podem usar o mesmo IP
+        registrar_porta = getattr(self.rede, 'registrar_porta', None)
+        if registrar_porta is not None:
+            registrar_porta(IPPROTO_TCP, porta, self._rdt_rcv)
+        else:
+            self.rede.registrar_recebedor(self._rdt_rcv)
 
     def registrar_monitor_de_conexoes_aceitas(self, callback):
         self.callback = callback
@@ -18,158 +400,1180 @@ class Servidor:
     def _rdt_rcv(self, src_addr, dst_addr, segment):
         src_port, dst_port, seq_no, ack_no, flags, window_size, checksum, urg_ptr = read_header(segment)
 
-        if dst_port != self.porta:
-            return
-        if not self.rede.ignore_checksum and calc_checksum(segment, src_addr, dst_addr) != 0:
-            print('descartando segmento com checksum incorreto')
+        if dst_port != self.porta or not self._checksum_valido(src_addr, dst_addr, segment):
             return
 
         payload_data = segment[4*(flags >> 12):]
         id_conexao = (src_addr, src_port, dst_addr, dst_port)
 
-        if (flags & FLAGS_SYN) == FLAGS_SYN:
-            ack_no = seq_no + 1
-            conexao = self.conexoes[id_conexao] = Conexao(self, id_conexao, seq_no, ack_no)
-            response_flags = FLAGS_SYN + FLAGS_ACK
-            resposta_segmento = fix_checksum(make_header(dst_port, src_port, seq_no, ack_no, response_flags), src_addr, dst_addr)
-            self.rede.enviar(resposta_segmento, src_addr)
-            if self.callback:
-                self.callback(conexao)
-        elif id_conexao in self.conexoes:
-            self.conexoes[id_conexao]._rdt_rcv(seq_no, ack_no, flags, payload_data)
+        conexao = self.conexoes.get(id_conexao)
+        if conexao is not None:
+            if (flags & FLAGS_SYN) != FLAGS_SYN:
+                conexao._rdt_rcv(seq_no, ack_no, flags, window_size, payload_data)
+            elif conexao.ack_no == conexao.seq_inicial_remoto + 1 and \
+                    (conexao.seq_inicial_remoto & 0xffffffff) == seq_no:
+                # SYN retransmitido (o SYN-ACK se perdeu ou atrasou): repete
+                # o SYN-ACK com o mesmo ISN
+                conexao._enviar_syn_ack()
+            else:
+                # SYN em uma conexão já sincronizada (RFC 5961, 4): pode ser
+                # forjado por quem só conhece os endereços e portas, então
+                # não derruba a conexão. O ACK (challenge ACK) faz uma outra
+                # ponta que de fato recomeçou responder com um RST aceitável.
+                conexao._enviar_ack()
+        elif (flags & FLAGS_RST) == FLAGS_RST:
+            # A outra ponta desistiu de um handshake ou de uma conexão em
+            # TIME_WAIT
+            semiaberta = self.semiabertas.get(id_conexao)
+            if semiaberta is not None:
+                if (semiaberta.seq_remoto + 1) & 0xffffffff == seq_no:
+                    del self.semiabertas[id_conexao]
+            elif not self.time_wait.tratar(self.rede, id_conexao, flags, seq_no):
+                self.desconhecidos += 1
+        elif (flags & FLAGS_SYN) == FLAGS_SYN:
+            # Um SYN novo também reabre uma conexão que estava em TIME_WAIT
+            self.time_wait.remover(id_conexao)
+            self._receber_syn(id_conexao, seq_no)
+        elif (flags & FLAGS_ACK) == FLAGS_ACK and self._completar_handshake(id_conexao, seq_no, ack_no, window_size):
+            # O ACK final pode trazer dados (ou o FIN)
+            if payload_data or (flags & FLAGS_FIN) == FLAGS_FIN:
+                self.conexoes[id_conexao]._rdt_rcv(seq_no, ack_no, flags, window_size, payload_data)
+        elif not self.time_wait.tratar(self.rede, id_conexao, flags, seq_no):
+            # Segmento de uma conexão desconhecida (já encerrada, ou de
+            # antes de a outra ponta ou nós recomeçarmos)
+            self.desconhecidos += 1
+            self._responder_rst(id_conexao, seq_no, ack_no, flags, payload_data)
+
+    def estatisticas(self):
+        """
+        Retorna um dicionário com as conexões abertas, semiabertas e em
+        TIME_WAIT, os contadores de segmentos recebidos, descartados por
+        checksum incorreto e de conexões desconhecidas, de conexões aceitas
+        e encerradas, de RSTs enviados, de SYN cookies e as retransmissões
+        de todas as conexões, abertas ou já encerradas.
+        """
+        estatisticas = self._estatisticas_conexoes()
+        estatisticas.update({'semiabertas': len(self.semiabertas),
+                             'desconhecidos': self.desconhecidos,
+                             'aceitas': self.aceitas,
+                             'cookies_enviados': self.cookies_enviados,
+                             'cookies_aceitos': self.cookies_aceitos})
+        return estatisticas
+
+    def _receber_syn(self, id_conexao, seq_no):
+        semiaberta = self.semiabertas.get(id_conexao)
+        if semiaberta is not None and semiaberta.seq_remoto == seq_no:
+            # SYN retransmitido (o SYN-ACK se perdeu ou atrasou): repete o
+            # SYN-ACK com o mesmo ISN
+            self._enviar_syn_ack(id_conexao, semiaberta.isn, seq_no + 1)
+            return
+        self.semiabertas.pop(id_conexao, None)
+        if len(self.semiabertas) >= self.backlog:
+            # Backlog cheio: responde sem guardar nada
+            self.cookies_enviados += 1
+            cookie = self._cookie(id_conexao, seq_no, int(time()) // PERIODO_COOKIE)
+            self._enviar_syn_ack(id_conexao, cookie, seq_no + 1)
+            return
+        isn = _gerar_isn()
+        self.semiabertas[id_conexao] = SemiAberta(isn, seq_no, time() + Conexao.RTO_INICIAL)
+        self._enviar_syn_ack(id_conexao, isn, seq_no + 1)
+        if not self.timer_semiabertas.ativo:
+            self.timer_semiabertas.armar(Conexao.RTO_INICIAL)
+
+    def _completar_handshake(self, id_conexao, seq_no, ack_no, janela):
+        """
+        Trata um ACK de uma conexão desconhecida como possível ACK final do
+        handshake, de uma conexão semiaberta ou de um SYN cookie. Se for,
+        cria a Conexao, avisa a aplicação e retorna True.
+        """
+        semiaberta = self.semiabertas.get(id_conexao)
+        if semiaberta is not None:
+            if ack_no != (semiaberta.isn + 1) & 0xffffffff:
+                return False
+            del self.semiabertas[id_conexao]
+            isn = semiaberta.isn
+            seq_no = semiaberta.seq_remoto + 1
         else:
-            print('%s:%d -> %s:%d (pacote associado a conexão desconhecida)' %
-                  (src_addr, src_port, dst_addr, dst_port))
+            isn = (ack_no - 1) & 0xffffffff
+            if not self._validar_cookie(id_conexao, (seq_no - 1) & 0xffffffff, isn):
+                return False
+            self.cookies_aceitos += 1
+        conexao = self.conexoes[id_conexao] = Conexao(self, id_conexao, isn + 1, seq_no, janela)
+        self.aceitas += 1
+        if self.callback:
+            self.callback(conexao)
+        return True
+
+    def _cookie(self, id_conexao, seq_remoto, contador):
+        """
+        SYN cookie (RFC 4987, 3.6): ISN que identifica a conexão sem que o
+        servidor precise guardá-la. Os 5 bits mais altos são o contador de
+        tempo e os outros 27, um hash com chave secreta dos endereços e
+        portas, do ISN da outra ponta e do contador. Como o MSS é fixo, não
+        é preciso codificá-lo.
+        """
+        src_addr, src_port, dst_addr, dst_port = id_conexao
+        dados = ('%s %d %s %d %d %d' % (src_addr, src_port, dst_addr, dst_port, seq_remoto, contador)).encode()
+        resumo = hashlib.blake2s(dados, digest_size=4, key=self.segredo_cookies).digest()
+        return (contador & 0x1f) << 27 | int.from_bytes(resumo, 'big') & 0x7ffffff
+
+    def _validar_cookie(self, id_conexao, seq_remoto, cookie):
+        atual = int(time()) // PERIODO_COOKIE
+        for contador in (atual, atual - 1):
+            if (contador & 0x1f) == cookie >> 27 and self._cookie(id_conexao, seq_remoto, contador) == cookie:
+                return True
+        return False
+
+    def _enviar_syn_ack(self, id_conexao, isn, ack_no):
+        self._enviar_controle(id_conexao, isn, ack_no, FLAGS_SYN | FLAGS_ACK)
+
+    def _retransmitir_syn_acks(self):
+        """
+        Timer das conexões semiabertas: retransmite os SYN-ACKs vencidos, com
+        backoff exponencial, e descarta as conexões que esgotaram as
+        tentativas. Há no máximo backlog delas, então basta percorrer todas.
+        """
+        agora = time()
+        proximo = None
+        for id_conexao, semiaberta in list(self.semiabertas.items()):
+            if semiaberta.proximo_envio <= agora:
+                if semiaberta.tentativas == self.TENTATIVAS_SYN_ACK:
+                    del self.semiabertas[id_conexao]
+                    continue
+                semiaberta.tentativas += 1
+                semiaberta.proximo_envio = agora + Conexao.RTO_INICIAL * 2**semiaberta.tentativas
+                self._enviar_syn_ack(id_conexao, semiaberta.isn, semiaberta.seq_remoto + 1)
+            if proximo is None or semiaberta.proximo_envio < proximo:
+                proximo = semiaberta.proximo_envio
+        if proximo is not None:
+            self.timer_semiabertas.armar(proximo - agora)
+
+
+# Faixa de portas efêmeras recomendada pela IANA (RFC 6335)
+PORTAS_EFEMERAS = range(49152, 65536)
+
+
+class Cliente(_PontaTCP):
+    """
+    Lado ativo do TCP: abre conexões com servidores (inclusive os desta
+    mesma pilha em outros nós). Como o Servidor, fornece às suas conexões a
+    camada de rede, a roda de timers e o controle de congestionamento.
+    """
+    # Quantas vezes o SYN é enviado antes de desistir
+    TENTATIVAS_SYN = 5
+
+    def __init__(self, rede, controle_congestionamento=Reno):
+        super().__init__(rede, controle_congestionamento)
+        # Handshakes em andamento, pela porta local: (endereço e porta do
+        # servidor, nosso ISN, futuro que recebe a Conexao)
+        self.abrindo = {}
+        # Portas locais em uso, por conexões abertas ou em abertura. A busca
+        # por uma porta livre começa em um ponto aleatório da faixa.
+        self.portas = set()
+        self.proxima_porta = random.choice(PORTAS_EFEMERAS)
+        self.abertas = 0
+        self.falhas_conexao = 0
+        self.registrar_porta = getattr(self.rede, 'registrar_porta', None)
+        if self.registrar_porta is None:
+            self.rede.registrar_recebedor(self._rdt_rcv)
+        self.porta_registrada = getattr(self.rede, 'porta_registrada', lambda proto, porta: False)
+
+    def _alocar_porta(self):
+        self.time_wait.limpar()
+        for _ in PORTAS_EFEMERAS:
+            porta = self.proxima_porta
+            self.proxima_porta += 1
+            if self.proxima_porta == PORTAS_EFEMERAS.stop:
+                self.proxima_porta = PORTAS_EFEMERAS.start
+            # Pula também as portas usadas por outros no mesmo IP (um
+            # Servidor ou outro Cliente)
+            if porta not in self.portas and not self.porta_registrada(IPPROTO_TCP, porta):
+                self.portas.add(porta)
+                if self.registrar_porta is not None:
+                    self.registrar_porta(IPPROTO_TCP, porta, self._rdt_rcv)
+                return porta
+        raise OSError('todas as portas efêmeras estão em uso')
+
+    def _liberar_id(self, id_conexao):
+        # A porta de uma conexão em TIME_WAIT só é liberada quando ela sai
+        # da tabela
+        self._liberar_porta(id_conexao[3])
+
+    def _liberar_porta(self, porta):
+        self.portas.discard(porta)
+        remover_porta = getattr(self.rede, 'remover_porta', None)
+        if remover_porta is not None:
+            remover_porta(IPPROTO_TCP, porta, self._rdt_rcv)
+
+    async def conectar(self, dest_addr, dest_port):
+        """
+        Abre uma conexão com dest_addr (string no formato x.y.z.w), porta
+        dest_port, e retorna a Conexao depois do three-way handshake. O SYN é
+        retransmitido com backoff exponencial; se não houver resposta,
+        levanta TimeoutError, e se a outra ponta responder com um RST,
+        ConnectionRefusedError. Se a chamada for cancelada, a porta local é
+        liberada (e a conexão fechada, se o handshake já tiver terminado).
+        """
+        loop = asyncio.get_running_loop()
+        porta = self._alocar_porta()
+        isn = _gerar_isn()
+        futuro = loop.create_future()
+        self.abrindo[porta] = (dest_addr, dest_port, isn, futuro)
+        conexao = None
+        try:
+            espera = Conexao.RTO_INICIAL
+            for _ in range(self.TENTATIVAS_SYN):
+                self._enviar_syn(porta, dest_addr, dest_port, isn)
+                try:
+                    conexao = await asyncio.wait_for(asyncio.shield(futuro), espera)
+                    return conexao
+                except asyncio.TimeoutError:
+                    espera *= 2
+            self.falhas_conexao += 1
+            raise TimeoutError('%s:%d não respondeu ao SYN' % (dest_addr, dest_port))
+        finally:
+            del self.abrindo[porta]
+            if conexao is None:
+                if futuro.done() and not futuro.cancelled() and futuro.exception() is None:
+                    # Cancelada logo depois do handshake: ninguém vai usar a
+                    # conexão, e a porta é liberada quando ela terminar
+                    futuro.result().fechar()
+                else:
+                    futuro.cancel()
+                    self._liberar_porta(porta)
+
+    def _enviar_syn(self, porta, dest_addr, dest_port, isn):
+        self._enviar_controle((dest_addr, dest_port, self.rede.meu_endereco, porta), isn, 0, FLAGS_SYN)
+
+    def _rdt_rcv(self, src_addr, dst_addr, segment):
+        src_port, dst_port, seq_no, ack_no, flags, window_size, checksum, urg_ptr = read_header(segment)
+
+        if dst_port not in self.portas or not self._checksum_valido(src_addr, dst_addr, segment):
+            return
+
+        id_conexao = (src_addr, src_port, dst_addr, dst_port)
+        payload = segment[4*(flags >> 12):]
+        conexao = self.conexoes.get(id_conexao)
+        if conexao is not None:
+            if (flags & FLAGS_SYN) == FLAGS_SYN:
+                # SYN-ACK repetido (nosso ACK do handshake se perdeu) ou
+                # qualquer outro SYN: só confirma, como challenge ACK (vide
+                # Servidor._rdt_rcv)
+                conexao._enviar_ack()
+            else:
+                conexao._rdt_rcv(seq_no, ack_no, flags, window_size, payload)
+            return
+        if self.time_wait.tratar(self.rede, id_conexao, flags, seq_no):
+            return
+
+        abrindo = self.abrindo.get(dst_port)
+        if abrindo is None or abrindo[3].done() or (src_addr, src_port) != abrindo[:2]:
+            self._responder_rst(id_conexao, seq_no, ack_no, flags, payload)
+            return
+        dest_addr, dest_port, isn, futuro = abrindo
+        if (flags & FLAGS_ACK) == FLAGS_ACK and ack_no != (isn + 1) & 0xffffffff:
+            # Não confirma o nosso SYN: de uma conexão anterior com a mesma
+            # porta (RFC 9293, 3.10.7.3)
+            self._responder_rst(id_conexao, seq_no, ack_no, flags, payload)
+            return
+        if (flags & FLAGS_RST) == FLAGS_RST:
+            if (flags & FLAGS_ACK) == FLAGS_ACK:
+                # Não há servidor na porta de destino
+                self.falhas_conexao += 1
+                futuro.set_exception(ConnectionRefusedError('%s:%d recusou a conexão' % (dest_addr, dest_port)))
+            return
+        if (flags & (FLAGS_SYN | FLAGS_ACK)) != FLAGS_SYN | FLAGS_ACK:
+            return
+        conexao = self.conexoes[id_conexao] = Conexao(self, id_conexao, isn + 1, seq_no + 1, window_size)
+        conexao._enviar_ack()
+        self.abertas += 1
+        futuro.set_result(conexao)
+
+    def estatisticas(self):
+        """
+        Retorna um dicionário com as conexões abertas, em abertura e em
+        TIME_WAIT, as portas locais em uso, os contadores de segmentos
+        recebidos e descartados por checksum incorreto, de conexões abertas,
+        que falharam e encerradas, de RSTs enviados e as retransmissões de
+        todas as conexões.
+        """
+        estatisticas = self._estatisticas_conexoes()
+        estatisticas.update({'abrindo': len(self.abrindo), 'portas': len(self.portas),
+                             'abertas': self.abertas,
+                             'falhas_conexao': self.falhas_conexao})
+        return estatisticas
+
+
+class PoolConexoes:
+    """
+    Guarda conexões abertas por um Cliente que estão livres, para
+    reaproveitá-las em novas requisições ao mesmo destino sem pagar o RTT
+    do handshake. A aplicação obtém uma conexão com obter(), registra nela o
+    seu recebedor e, ao terminar a requisição, a devolve com devolver() em
+    vez de fechá-la. Conexões livres que a outra ponta fecha são fechadas
+    também, liberando a porta local sem esperar pelo próximo obter().
+    """
+    def __init__(self, cliente, maximo_livres=4):
+        self.cliente = cliente
+        self.maximo_livres = maximo_livres
+        self.livres = {}    # (endereço, porta) -> conexões livres
+        self.abertas = 0
+        self.reaproveitadas = 0
+
+    @staticmethod
+    def _reaproveitavel(conexao):
+        return conexao.estado == ESTABLISHED
+
+    async def obter(self, dest_addr, dest_port):
+        livres = self.livres.get((dest_addr, dest_port))
+        while livres:
+            conexao = livres.pop()
+            if self._reaproveitavel(conexao):
+                conexao.registrar_recebedor(None)
+                self.reaproveitadas += 1
+                return conexao
+            conexao.fechar()
+        self.abertas += 1
+        return await self.cliente.conectar(dest_addr, dest_port)
+
+    def devolver(self, conexao):
+        """
+        Devolve uma conexão obtida do pool. Ela é fechada se o outro lado já
+        a tiver fechado ou se já houver maximo_livres conexões livres para o
+        mesmo destino.
+        """
+        src_addr, src_port, dst_addr, dst_port = conexao.id_conexao
+        livres = self.livres.setdefault((src_addr, src_port), [])
+        if self._reaproveitavel(conexao) and len(livres) < self.maximo_livres:
+            livres.append(conexao)
+            conexao.registrar_recebedor(self._livre_recebeu)
+        else:
+            conexao.fechar()
+
+    def _livre_recebeu(self, conexao, dados):
+        """
+        Recebedor das conexões livres. O fim da conexão (dados vazios, que
+        também chegam se ela for abortada) a tira do pool; dados fora de
+        hora também, já que seriam confundidos com a resposta da próxima
+        requisição. Em ambos os casos, a conexão é fechada do nosso lado.
+        """
+        src_addr, src_port, dst_addr, dst_port = conexao.id_conexao
+        livres = self.livres.get((src_addr, src_port))
+        if livres and conexao in livres:
+            livres.remove(conexao)
+        conexao.fechar()
+
+
+class SegmentoEnviado:
+    """
+    Segmento já montado (com cabeçalho e checksum) que aguarda confirmação,
+    guardado na fila de envio da conexão para eventuais retransmissões.
+    """
+    def __init__(self, seq_no, dados, segmento, tempo_envio, fin=False):
+        self.seq_no = seq_no
+        self.dados = dados
+        self.segmento = segmento
+        # Número de sequência seguinte ao segmento (o FIN ocupa um)
+        self.fim = seq_no + len(dados) + fin
+        # Instante da última transmissão, quantas vezes foi retransmitido e
+        # quantas vezes foi enviado como sonda de janela zero
+        self.tempo_envio = tempo_envio
+        self.retransmissoes = 0
+        self.sondas = 0
 
 
 class Conexao:
-    def __init__(self, servidor, id_conexao, seq_no, ack_no):
+    # Se False, segmentos fora de ordem são descartados em vez de guardados
+    # para remontagem (útil apenas para comparar o desempenho das duas formas)
+    remontar_fora_de_ordem = True
+    # Se False, perdas só são recuperadas pelo timer de retransmissão, sem
+    # retransmissão rápida após três ACKs duplicados (idem)
+    retransmissao_rapida = True
+    # ACKs atrasados (RFC 1122, 4.2.3.2): os dados recebidos em ordem só são
+    # confirmados na hora a cada SEGMENTOS_POR_ACK segmentos cheios; senão, o
+    # ACK espera até ATRASO_ACK segundos, e vai junto com os dados se a
+    # aplicação responder antes disso. Com atrasar_acks False, todo segmento
+    # é confirmado assim que chega, como originalmente.
+    atrasar_acks = True
+    SEGMENTOS_POR_ACK = 2
+    ATRASO_ACK = 0.1
+    # Limites do intervalo de retransmissão (RTO), em segundos. A RFC 6298
+    # recomenda mínimo de 1 s; usamos 200 ms, como o Linux, porque o RTT nas
+    # linhas seriais costuma ser bem menor que isso
+    RTO_INICIAL = 1
+    RTO_MINIMO = 0.2
+    RTO_MAXIMO = 60
+    # Quantidade de eventos guardados em historico_rtt
+    TAMANHO_HISTORICO_RTT = 1000
+    # Timeouts seguidos sem resposta da outra ponta antes de desistir da
+    # conexão (com o backoff, cerca de 15 min, como o tcp_retries2 do Linux)
+    MAXIMO_RETRANSMISSOES = 15
+    # Tempo máximo em FIN_WAIT_2 esperando o FIN da outra ponta, depois que
+    # a aplicação fechou a conexão (tcp_fin_timeout do Linux)
+    DURACAO_FIN_WAIT_2 = 60
+
+    def __init__(self, servidor, id_conexao, seq_no, ack_no, janela_remota=MSS):
+        """
+        Cria uma conexão já sincronizada: seq_no é o número de sequência do
+        primeiro byte que enviaremos (nosso ISN + 1) e ack_no o do primeiro
+        byte que esperamos receber (ISN da outra ponta + 1). O servidor pode
+        ser um Servidor ou um Cliente (usamos a camada de rede, os timers e o
+        controle de congestionamento dele).
+        """
         self.servidor = servidor
         self.id_conexao = id_conexao
         self.callback = None
-        self.timer = None
+        self.callback_envio = None
+        self.callback_aborto = None
+        self.timer = servidor.timers.criar(self._timer)
 
-        self.seq_no = seq_no
+        self.seq_inicial = seq_no - 1
+        self.seq_inicial_remoto = ack_no - 1
         self.ack_no = ack_no
         self.ack_client = ack_no
-        self.seq_client = ack_no
+        self.seq_client = seq_no
+
+        # Dados da aplicação ainda não segmentados: pedaços na ordem em que
+        # foram passados a enviar, o deslocamento já consumido do primeiro
+        # pedaço e o total de bytes pendentes
+        self.buffer_envio = deque()
+        self.offset_envio = 0
+        self.bytes_pendentes = 0
+        # Segmentos transmitidos e não confirmados, em ordem crescente de
+        # número de sequência
+        self.fila_envio = deque()
+        # Janela de recepção anunciada pela outra ponta e timer de
+        # persistência, usado para sondar a outra ponta quando ela é zero.
+        # Enquanto isso, é ele, e não o timer de retransmissão, que cobre a
+        # fila de envio, com backoff próprio: sondas conta as sondas enviadas
+        # desde que a janela fechou, e sondas_sem_resposta, as que ainda não
+        # tiveram resposta.
+        self.rwnd = janela_remota
+        # Números de sequência e de confirmação do segmento que trouxe a
+        # janela atual (SND.WL1 e SND.WL2 da RFC 9293)
+        self.wl1 = ack_no - 1
+        self.wl2 = seq_no
+        self.timer_persistencia = servidor.timers.criar(self._sondar_janela)
+        self.sondas = 0
+        self.sondas_sem_resposta = 0
 
-        self.dados_enviados = {}
-        self.segmentos = {}
-        self.intervalo_timeout = 1
+        # Dados recebidos em ordem que ainda não foram entregues à aplicação
+        # (enquanto o recebimento estiver pausado). A janela anunciada é o
+        # espaço livre neste buffer.
+        self.tamanho_buffer_recepcao = TAMANHO_BUFFER_RECEPCAO
+        self.buffer_recepcao = bytearray()
+        self.recebimento_pausado = False
+        self.fin_recebido = False
+        self.fin_entregue = False
+        # Trechos recebidos fora de ordem, dentro da janela anunciada: listas
+        # paralelas com o número de sequência inicial (ordenado) e os dados
+        # de cada intervalo, e o número de sequência do FIN, se já chegou
+        self.fora_de_ordem_inicios = []
+        self.fora_de_ordem_blocos = []
+        self.fin_fora_de_ordem = None
+        # Último ack_no enviado à outra ponta, em ACKs ou junto com dados, e
+        # timer do ACK atrasado
+        self.ack_enviado = ack_no
+        self.timer_ack = servidor.timers.criar(self._enviar_ack)
+
+        # Estimativa do RTT (RFC 6298): última amostra, média e desvio
+        # suavizados e o RTO resultante. O histórico guarda tuplas (instante,
+        # amostra, RTO) a cada amostra, e (instante, None, RTO) a cada vez que
+        # o RTO dobra por causa de um timeout.
+        self.intervalo_timeout = self.RTO_INICIAL
         self.exemplo_rtt = 0
         self.DevRTT = 0
         self.rtt_estimado = 0
-        self.tempo_envio = 0
-        self.rcv_cwnd = 0
-        self.cwnd = MSS
-        self.open = True
-        self.reenvio = False
-        
+        self.rtt_minimo = None
+        self.historico_rtt = deque(maxlen=self.TAMANHO_HISTORICO_RTT)
+        self.retransmissoes = 0
+        self.retransmissoes_espurias = 0
+        # Timeouts desde o último ACK que mostrou que a outra ponta está
+        # viva: um que confirmou dados novos ou que anunciou janela zero
+        self.timeouts_seguidos = 0
+        self.congestionamento = servidor.controle_congestionamento()
+        # Maior ACK recebido (início dos dados não confirmados), quantidade
+        # de ACKs duplicados seguidos e estado da recuperação rápida (NewReno):
+        # ela termina quando for confirmado tudo até recuperar_ate
+        self.ultimo_ack = seq_no
+        self.acks_duplicados = 0
+        self.em_recuperacao = False
+        self.recuperar_ate = None
+        # Depois de um timeout, tudo o que estava em trânsito é dado como
+        # perdido e retransmitido em ordem (go-back-N), à medida que a janela
+        # de congestionamento deixa: reenviar_de é o início do próximo
+        # segmento a retransmitir e reenviar_ate o ponto de recuperação
+        # (seq_client no timeout), ou None fora dessa retransmissão
+        self.reenviar_de = seq_no
+        self.reenviar_ate = None
+
+        # Estado da conexão (vide constantes no início do módulo). Depois que
+        # a aplicação chama fechar(), o FIN é enviado assim que os dados
+        # pendentes acabarem, com o número de sequência seq_fin.
+        self.estado = ESTABLISHED
+        self.fin_pendente = False
+        self.seq_fin = None
+        self.timer_fechamento = servidor.timers.criar(self._expirar_fin_wait_2)
+
+    def _reiniciar_timer(self):
+        if self.rwnd == 0:
+            # Janela zero: a fila fica com o timer de persistência, já que
+            # a outra ponta não tem onde guardar o que for retransmitido
+            self.timer.cancelar()
+            if not self.timer_persistencia.ativo:
+                self._armar_persistencia()
+        else:
+            self.timer_persistencia.cancelar()
+            self.timer.armar(self.intervalo_timeout)
+
+    def _armar_persistencia(self):
+        # Backoff exponencial a partir do RTO, limitado a RTO_MAXIMO
+        self.timer_persistencia.armar(min(self.intervalo_timeout * 2**min(self.sondas, 16),
+                                          self.RTO_MAXIMO))
+
+    def _parar_timer(self):
+        self.timer.cancelar()
 
     def _timer(self):
-        self.reenvio = True
-        self.cwnd = ((self.cwnd // MSS) // 2) * MSS
-        self.enviar(self.dados_enviados[list(self.dados_enviados.keys())[0]])
-
-    def _rdt_rcv(self, seq_no, ack_no, flags, payload):
-        if len(self.dados_enviados):
-            if not self.reenvio:
-                first = self.exemplo_rtt == 0
-                self.exemplo_rtt = time() - self.tempo_envio
-                if first:
-                    self.rtt_estimado = self.exemplo_rtt
-                    self.DevRTT = self.exemplo_rtt / 2
-                else:
-                    self.rtt_estimado = 0.875 * self.rtt_estimado + 0.125 * self.exemplo_rtt
-                    self.DevRTT = 0.75 * self.DevRTT + 0.25 * abs(self.exemplo_rtt - self.rtt_estimado)
-                self.intervalo_timeout = self.rtt_estimado + 4 * self.DevRTT
-
-            if ack_no > list(self.dados_enviados.keys())[0]:
-                temp = list(self.dados_enviados.keys())[0]
-                while temp < ack_no:
-                    self.rcv_cwnd += len(self.segmentos[temp])
-                    del self.dados_enviados[temp]
-                    del self.segmentos[temp]
-                    if len(self.dados_enviados) == 0:
-                        break
-                    temp = list(self.dados_enviados.keys())[0]
-
-                if len(self.dados_enviados):
-                    if self.timer is not None:
-                        self.timer.cancel()
-                    self.timer = asyncio.get_event_loop().call_later(self.intervalo_timeout, self._timer)
-                else:
-                    self.timer.cancel()
+        if not self.fila_envio:
+            return
+        if self.timeouts_seguidos >= self.MAXIMO_RETRANSMISSOES:
+            # A outra ponta parou de responder
+            self._abortar()
+            return
+        self.timeouts_seguidos += 1
+        self.congestionamento.ao_expirar(self.seq_client - self.ultimo_ack)
+        self.em_recuperacao = False
+        self.acks_duplicados = 0
+        # Backoff exponencial: o RTO só volta a ser calculado a partir do RTT
+        # quando chegar uma amostra válida
+        self.intervalo_timeout = min(2 * self.intervalo_timeout, self.RTO_MAXIMO)
+        self.historico_rtt.append((time(), None, self.intervalo_timeout))
+        # O primeiro segmento vai já; os demais que estavam em trânsito, por
+        # _reenviar_perdidos, conforme os ACKs abrirem a janela
+        self.reenviar_ate = self.seq_client
+        self.reenviar_de = self.fila_envio[0].fim
+        if self.reenviar_de >= self.reenviar_ate:
+            self.reenviar_ate = None
+        self._retransmitir_primeiro()
+
+    def _retransmitir(self, segmento):
+        segmento.retransmissoes += 1
+        segmento.tempo_envio = time()
+        self.retransmissoes += 1
+        self.servidor.rede.enviar(segmento.segmento, self.id_conexao[0])
 
-                if self.rcv_cwnd >= self.cwnd or len(self.dados_enviados) == 0:
-                    self.cwnd += MSS
-                    self.rcv_cwnd = 0
-                    if len(self.dados_enviados):
-                        if self.timer is not None:
-                            self.timer.cancel()
-                        self.timer = asyncio.get_event_loop().call_later(self.intervalo_timeout, self._timer)
-                        self.enviar(self.dados_enviados[list(self.dados_enviados.keys())[0]])
+    def _retransmitir_primeiro(self):
+        """
+        Retransmite o primeiro segmento não confirmado e reinicia o timer.
+        """
+        self._retransmitir(self.fila_envio[0])
+        self._reiniciar_timer()
 
-        self.reenvio = False
+    def _reenviar_perdidos(self):
+        """
+        Continua a retransmissão em ordem iniciada por um timeout (RFC 5681,
+        3.1): retransmite, a partir de reenviar_de, os segmentos enviados
+        antes do timeout enquanto couberem na janela, contando como em
+        trânsito só o que já foi retransmitido. Os segmentos que um ACK
+        cumulativo já cobriu, porque a outra ponta os tinha guardado fora de
+        ordem, são pulados.
+        """
+        inicio = max(self.reenviar_de, self.ultimo_ack)
+        janela = min(self.congestionamento.cwnd, self.rwnd)
+        for segmento in self.fila_envio:
+            if segmento.fim <= inicio:
+                continue
+            if segmento.seq_no >= self.reenviar_ate or segmento.fim - self.ultimo_ack > janela:
+                break
+            self._retransmitir(segmento)
+            inicio = segmento.fim
+        self.reenviar_de = inicio
+        if inicio >= self.reenviar_ate:
+            self.reenviar_ate = None
 
-        if seq_no != self.ack_no or (len(payload) == 0 and (flags & FLAGS_FIN) != FLAGS_FIN) or not self.open:
+    def _rdt_rcv(self, seq_no, ack_no, flags, window_size, payload):
+        seq_no = _desdobrar(seq_no, self.ack_no)
+        ack_no = _desdobrar(ack_no, self.ultimo_ack)
+        if (flags & FLAGS_RST) == FLAGS_RST:
+            self._receber_rst(seq_no)
+            return
+        fila = self.fila_envio
+        if (flags & FLAGS_ACK) == FLAGS_ACK:
+            janela_anterior = self.rwnd
+            if ack_no >= self.ultimo_ack and \
+                    (seq_no > self.wl1 or (seq_no == self.wl1 and ack_no >= self.wl2)):
+                # Só um segmento mais novo que o da última atualização muda a
+                # janela (RFC 9293, 3.10.7.4): um atrasado ou reordenado
+                # traria uma janela velha
+                self.rwnd = window_size
+                self.wl1 = seq_no
+                self.wl2 = ack_no
+            # Qualquer ACK responde às sondas de janela zero
+            self.sondas_sem_resposta = 0
+            if self.rwnd:
+                self.sondas = 0
+            elif ack_no == self.ultimo_ack:
+                # A outra ponta está viva, só sem espaço para o que enviamos:
+                # os timeouts até aqui não contam para desistir da conexão
+                self.timeouts_seguidos = 0
+            if ack_no > self.ultimo_ack:
+                self._ack_novo(ack_no)
+            elif ack_no == self.ultimo_ack and fila and not payload and \
+                    (flags & FLAGS_FIN) != FLAGS_FIN and window_size == janela_anterior and window_size:
+                self._ack_duplicado()
+            if self.estado in (CLOSED, TIME_WAIT):
+                # O ACK do nosso FIN encerrou a conexão
+                return
+            if fila and (self.rwnd == 0) == self.timer.ativo:
+                # A janela fechou ou reabriu: troca o timer que cobre a fila.
+                # Se reabriu sem confirmar a sonda, ela foi descartada por
+                # estar além da janela zero, e é repetida já, antes dos dados
+                # que a janela liberou, para não parecer uma perda.
+                if self.rwnd and fila[0].sondas:
+                    self._repetir_sonda()
+                self._reiniciar_timer()
+
+        # A janela pode ter andado ou aberto: transmite o que couber
+        pendentes = self.bytes_pendentes
+        self._enviar_janela()
+        if self.callback_envio and self.bytes_pendentes != pendentes:
+            self.callback_envio(self)
+
+        fin = (flags & FLAGS_FIN) == FLAGS_FIN
+        if len(payload) == 0 and not fin:
+            return
+        if seq_no < self.ack_no:
+            # Descarta a parte já recebida (retransmissão que se sobrepõe),
+            # inclusive o FIN, se ele já tiver sido confirmado
+            if seq_no + len(payload) < self.ack_no:
+                fin = False
+            payload = payload[self.ack_no - seq_no:]
+            seq_no = self.ack_no
+            if not payload and not fin:
+                self._enviar_ack()
+                return
+        if self.fin_recebido:
+            # Nada pode vir depois do FIN
+            self._enviar_ack()
+            return
+
+        # Aceita só o que cabe na janela anunciada; o restante (inclusive a
+        # sonda de janela zero) é descartado e será retransmitido
+        livre = self.ack_no + self._janela_anunciada() - seq_no
+        if len(payload) > livre:
+            payload = payload[:max(0, livre)]
+            fin = False
+
+        if seq_no != self.ack_no:
+            # Fora de ordem: guarda para quando o buraco antes dele for
+            # preenchido e confirma de novo o que já temos
+            if self.remontar_fora_de_ordem:
+                self._guardar_fora_de_ordem(seq_no, payload, fin)
+            self._enviar_ack()
+            return
+        if not payload and not fin:
+            self._enviar_ack()
             return
 
-        src_addr, src_port, dst_addr, dst_port = self.id_conexao
-        self.seq_no = self.ack_no
         self.ack_no += len(payload)
-        if (flags & FLAGS_FIN) == FLAGS_FIN:
+        self.buffer_recepcao += payload
+        # Segmentos que preenchem um buraco são confirmados na hora, para
+        # que o transmissor saia logo da recuperação rápida
+        preencheu_buraco = bool(self.fora_de_ordem_inicios)
+        if preencheu_buraco:
+            self._remontar()
+        if fin or self.ack_no == self.fin_fora_de_ordem:
             self.ack_no += 1
+            self.fin_recebido = True
+            if self.estado == ESTABLISHED:
+                self.estado = CLOSE_WAIT
+            elif self.estado == FIN_WAIT_1:
+                # Fechamento simultâneo: falta o ACK do nosso FIN
+                self.estado = CLOSING
+            elif self.estado == FIN_WAIT_2:
+                self.estado = TIME_WAIT
         self.ack_client = self.ack_no
-        flags = FLAGS_ACK
-        self.callback(self, payload)
-        new_segment = fix_checksum(make_header(dst_port, src_port, self.seq_no, self.ack_no, flags), src_addr, dst_addr)
-        self.servidor.rede.enviar(new_segment, src_addr)
+        self._entregar()
+        self._confirmar(preencheu_buraco or self.fin_recebido)
+        if self.estado == TIME_WAIT:
+            self._encerrar()
+
+    def _receber_rst(self, seq_no):
+        """
+        Trata um RST (RFC 5961, 3.2): só aborta a conexão se ele vier
+        exatamente no próximo número de sequência esperado. Um RST em outro
+        ponto da janela pode ter sido forjado por quem só acertou a janela,
+        então é respondido com um ACK (challenge ACK), ao qual uma outra
+        ponta que de fato perdeu a conexão responde com um RST exato. Fora
+        da janela, é descartado.
+        """
+        if seq_no == self.ack_no:
+            self._abortar()
+        elif self.ack_no < seq_no < self.ack_no + self._janela_anunciada():
+            self._enviar_ack()
+
+    def _guardar_fora_de_ordem(self, seq_no, payload, fin):
+        """
+        Guarda um trecho recebido fora de ordem. Os trechos são mantidos como
+        intervalos disjuntos e ordenados [inicio, inicio + len(bloco)), e um
+        trecho novo é fundido com os que ele sobrepõe ou encosta.
+        """
+        fim = seq_no + len(payload)
+        if fin:
+            self.fin_fora_de_ordem = fim
+        if not payload:
+            return
+        inicios = self.fora_de_ordem_inicios
+        blocos = self.fora_de_ordem_blocos
+        i = bisect.bisect_left(inicios, seq_no)
+        if i > 0 and inicios[i - 1] + len(blocos[i - 1]) >= seq_no:
+            i -= 1
+        j = i
+        while j < len(inicios) and inicios[j] <= fim:
+            j += 1
+        if i == j:
+            inicios.insert(i, seq_no)
+            blocos.insert(i, bytes(payload))
+            return
+        inicio = min(seq_no, inicios[i])
+        final = max(fim, inicios[j - 1] + len(blocos[j - 1]))
+        bloco = bytearray(final - inicio)
+        bloco[seq_no - inicio:fim - inicio] = payload
+        for k in range(i, j):
+            bloco[inicios[k] - inicio:inicios[k] - inicio + len(blocos[k])] = blocos[k]
+        inicios[i:j] = [inicio]
+        blocos[i:j] = [bytes(bloco)]
+
+    def _remontar(self):
+        """
+        Move para o buffer de recepção os trechos fora de ordem que ficaram
+        contíguos aos dados já recebidos.
+        """
+        inicios = self.fora_de_ordem_inicios
+        blocos = self.fora_de_ordem_blocos
+        while inicios and inicios[0] <= self.ack_no:
+            inicio = inicios.pop(0)
+            bloco = blocos.pop(0)
+            novo = bloco[self.ack_no - inicio:]
+            self.buffer_recepcao += novo
+            self.ack_no += len(novo)
+
+    def _ack_novo(self, ack_no):
+        fila = self.fila_envio
+        self.ultimo_ack = ack_no
+        self.acks_duplicados = 0
+        self.timeouts_seguidos = 0
+
+        # ACK cumulativo: retira da frente da fila os segmentos inteiramente
+        # confirmados, cada um em O(1)
+        confirmados = 0
+        ultimo = None
+        retransmitido = None
+        while fila and fila[0].fim <= ack_no:
+            ultimo = fila.popleft()
+            confirmados += len(ultimo.dados)
+            if (ultimo.retransmissoes or ultimo.sondas) and retransmitido is None:
+                retransmitido = ultimo
 
-        if (flags & FLAGS_FIN) == FLAGS_FIN:
-            self.fechar()
+        if ultimo is not None:
+            agora = time()
+            if retransmitido is None:
+                self._amostrar_rtt(agora, agora - ultimo.tempo_envio)
+            elif retransmitido.retransmissoes and self.rtt_minimo is not None and \
+                    agora - retransmitido.tempo_envio < self.rtt_minimo / 2:
+                # Algoritmo de Karn: não há como saber se o ACK se refere à
+                # transmissão original ou à retransmissão, então não é feita
+                # amostra. Mas se ele chegou antes de meio RTT mínimo após a
+                # retransmissão, certamente se refere à original, e a
+                # retransmissão foi desnecessária.
+                self.retransmissoes_espurias += 1
+
+        if fila:
+            self._reiniciar_timer()
+        else:
+            self._parar_timer()
+
+        if self.em_recuperacao:
+            if ack_no >= self.recuperar_ate:
+                # Tudo o que estava em trânsito na perda foi confirmado
+                self.em_recuperacao = False
+                self.congestionamento.ao_sair_da_recuperacao()
+            else:
+                # ACK parcial: o segmento seguinte também se perdeu
+                self.congestionamento.ao_confirmar_parcial(confirmados)
+                self._retransmitir_primeiro()
+        elif confirmados:
+            self.congestionamento.ao_confirmar(confirmados, self.rtt_estimado)
+        if registro.ativo:
+            _hist_cwnd.registrar(self.congestionamento.cwnd)
+            _hist_fila_envio.registrar(len(fila))
+
+        if self.seq_fin is not None and ack_no > self.seq_fin:
+            self._fin_confirmado()
+
+    def _amostrar_rtt(self, agora, amostra):
+        # O histórico não serve para reconhecer a primeira amostra, pois
+        # também guarda os timeouts, que podem acontecer antes dela
+        if self.rtt_minimo is None:
+            self.rtt_estimado = amostra
+            self.DevRTT = amostra / 2
+        else:
+            self.DevRTT = 0.75 * self.DevRTT + 0.25 * abs(amostra - self.rtt_estimado)
+            self.rtt_estimado = 0.875 * self.rtt_estimado + 0.125 * amostra
+        self.exemplo_rtt = amostra
+        if self.rtt_minimo is None or amostra < self.rtt_minimo:
+            self.rtt_minimo = amostra
+        self.intervalo_timeout = min(max(self.rtt_estimado + 4 * self.DevRTT,
+                                         self.RTO_MINIMO), self.RTO_MAXIMO)
+        self.historico_rtt.append((agora, amostra, self.intervalo_timeout))
+        if registro.ativo:
+            _hist_rtt.registrar(amostra)
+
+    def estatisticas_rtt(self):
+        """
+        Retorna um dicionário com a estimativa atual do RTT, o RTO e os
+        contadores de retransmissões (total e das que se mostraram
+        desnecessárias). O histórico completo fica em historico_rtt.
+        """
+        return {'rtt_estimado': self.rtt_estimado, 'desvio_rtt': self.DevRTT,
+                'rtt_minimo': self.rtt_minimo, 'rto': self.intervalo_timeout,
+                'amostras': len(self.historico_rtt),
+                'retransmissoes': self.retransmissoes,
+                'retransmissoes_espurias': self.retransmissoes_espurias}
+
+    def _ack_duplicado(self):
+        self.acks_duplicados += 1
+        if self.em_recuperacao:
+            # Cada ACK duplicado indica que mais um segmento saiu da rede
+            self.congestionamento.ao_receber_duplicado()
+        elif self.acks_duplicados == 3 and self.retransmissao_rapida and self.reenviar_ate is None:
+            # Retransmissão rápida: três ACKs duplicados indicam a perda do
+            # primeiro segmento não confirmado, sem esperar pelo timeout. Não
+            # vale durante a retransmissão depois de um timeout, em que os
+            # duplicados vêm dos próprios segmentos retransmitidos.
+            self.congestionamento.ao_detectar_perda(self.seq_client - self.ultimo_ack)
+            self.em_recuperacao = True
+            self.recuperar_ate = self.seq_client
+            self._retransmitir_primeiro()
+
+    def _janela_anunciada(self):
+        """
+        Espaço livre no buffer de recepção, anunciado como janela à outra ponta.
+        """
+        return max(0, self.tamanho_buffer_recepcao - len(self.buffer_recepcao))
+
+    def _enviar_syn_ack(self):
+        src_addr, src_port, dst_addr, dst_port = self.id_conexao
+        segmento = fix_checksum(montar_cabecalho(dst_port, src_port, self.seq_inicial, self.ack_no, FLAGS_SYN | FLAGS_ACK, self._janela_anunciada()), src_addr, dst_addr)
+        self.servidor.rede.enviar(segmento, src_addr)
+
+    def _confirmar(self, imediato):
+        """
+        Confirma os dados recebidos em ordem seguindo a política de ACKs
+        atrasados, a menos que a resposta da aplicação já os tenha confirmado.
+        Sem ACKs atrasados, confirma sempre.
+        """
+        if not self.atrasar_acks:
+            self._enviar_ack()
+        elif self.ack_enviado == self.ack_no:
+            return
+        elif imediato or self.ack_no - self.ack_enviado >= self.SEGMENTOS_POR_ACK * MSS:
+            self._enviar_ack()
+        elif not self.timer_ack.ativo:
+            self.timer_ack.armar(self.ATRASO_ACK)
+
+    def _enviar_ack(self):
+        src_addr, src_port, dst_addr, dst_port = self.id_conexao
+        segmento = fix_checksum(montar_cabecalho(dst_port, src_port, self.seq_client, self.ack_no, FLAGS_ACK, self._janela_anunciada()), src_addr, dst_addr)
+        self.servidor.rede.enviar(segmento, src_addr)
+        self._ack_enviado()
+
+    def _ack_enviado(self):
+        self.ack_enviado = self.ack_no
+        self.timer_ack.cancelar()
+
+    def _entregar(self):
+        """
+        Entrega à aplicação os dados do buffer de recepção e, depois deles, o
+        fim da conexão (dados vazios), a menos que o recebimento esteja pausado.
+        """
+        if self.recebimento_pausado or self.callback is None:
+            return
+        if self.buffer_recepcao:
+            dados = bytes(self.buffer_recepcao)
+            self.buffer_recepcao.clear()
+            self.callback(self, dados)
+        if self.fin_recebido and not self.fin_entregue and not self.recebimento_pausado:
+            self.fin_entregue = True
+            self.callback(self, b'')
+
+    def pausar_recebimento(self):
+        """
+        Para de entregar dados à aplicação. Os dados que chegarem ficam no
+        buffer de recepção, diminuindo a janela anunciada à outra ponta, que
+        para de transmitir quando o buffer enche.
+        """
+        self.recebimento_pausado = True
+
+    def retomar_recebimento(self):
+        """
+        Volta a entregar dados à aplicação, começando pelos que estavam no
+        buffer de recepção, e avisa a outra ponta se a janela reabriu.
+        """
+        self.recebimento_pausado = False
+        janela_antes = self._janela_anunciada()
+        self._entregar()
+        if janela_antes < MSS <= self._janela_anunciada() and self.estado != CLOSED:
+            self._enviar_ack()
 
     def registrar_recebedor(self, callback):
         self.callback = callback
+        # Entrega o que tiver chegado antes de haver um recebedor, o que pode
+        # acontecer em conexões abertas por um Cliente
+        if (self.buffer_recepcao or self.fin_recebido) and not self.recebimento_pausado:
+            self.retomar_recebimento()
+
+    def registrar_monitor_de_envio(self, callback):
+        """
+        Registra uma função para ser chamada, com a conexão como argumento,
+        sempre que ACKs liberarem a transmissão de dados que estavam
+        aguardando em buffer_envio (vide bytes_pendentes).
+        """
+        self.callback_envio = callback
+
+    def registrar_monitor_de_aborto(self, callback):
+        """
+        Registra uma função para ser chamada, com a conexão como argumento,
+        se ela for descartada sem o fechamento normal: quando a outra ponta
+        para de responder ou recomeça a conexão com um SYN novo.
+        """
+        self.callback_aborto = callback
 
     def enviar(self, dados):
-        if not self.open:
+        """
+        Enfileira dados para envio. Os segmentos só são montados quando a
+        janela de congestionamento permite transmiti-los, e dados passados
+        enquanto outros ainda estão em trânsito aguardam a vez na fila.
+        """
+        if self.fin_pendente or self.estado == CLOSED or not dados:
             return
+        if not isinstance(dados, bytes):
+            # Copia, já que a aplicação pode alterar o objeto depois
+            dados = bytes(dados)
+        self.buffer_envio.append(dados)
+        self.bytes_pendentes += len(dados)
+        self._enviar_janela()
 
+    def _retirar_do_buffer(self, n):
+        """
+        Retira até n bytes do início dos dados pendentes de envio.
+        """
+        pedaco = self.buffer_envio[0]
+        inicio = self.offset_envio
+        if len(pedaco) - inicio > n:
+            # Caso comum: o primeiro pedaço tem dados de sobra
+            self.offset_envio += n
+            self.bytes_pendentes -= n
+            return pedaco[inicio:inicio + n]
+        partes = []
+        while n > 0 and self.buffer_envio:
+            pedaco = self.buffer_envio[0]
+            parte = pedaco[self.offset_envio:self.offset_envio + n]
+            partes.append(parte)
+            n -= len(parte)
+            if self.offset_envio + len(parte) == len(pedaco):
+                self.buffer_envio.popleft()
+                self.offset_envio = 0
+            else:
+                self.offset_envio += len(parte)
+        dados = b''.join(partes)
+        self.bytes_pendentes -= len(dados)
+        return dados
+
+    def _enviar_janela(self):
+        """
+        Monta e transmite novos segmentos a partir dos dados pendentes
+        enquanto os bytes em trânsito couberem tanto na janela de
+        congestionamento quanto na janela anunciada pela outra ponta. Se a
+        aplicação já fechou a conexão, o FIN segue o último segmento. Depois
+        de um timeout, os dados novos só saem quando todos os segmentos que
+        estavam em trânsito tiverem sido retransmitidos.
+        """
+        if self.reenviar_ate is not None:
+            self._reenviar_perdidos()
+            if self.reenviar_ate is not None:
+                return
+        if not self.bytes_pendentes:
+            self._enviar_fin_pendente()
+            return
+        src_addr, src_port, dst_addr, dst_port = self.id_conexao
+        fila = self.fila_envio
+        em_transito = self.seq_client - fila[0].seq_no if fila else 0
+        janela = min(self.congestionamento.cwnd, self.rwnd)
+        enviou = False
+        while self.bytes_pendentes:
+            n = min(MSS, self.bytes_pendentes, janela - em_transito)
+            # Não envia segmentos menores que o MSS só porque a janela está
+            # quase cheia, a não ser que não haja nada em trânsito
+            if n <= 0 or (n < MSS and n < self.bytes_pendentes and em_transito):
+                break
+            payload = self._retirar_do_buffer(n)
+            self._transmitir_novo(payload)
+            em_transito += n
+            enviou = True
+
+        if enviou:
+            if not self.timer.ativo:
+                self._reiniciar_timer()
+            self._enviar_fin_pendente()
+        elif not fila and self.rwnd == 0 and not self.timer_persistencia.ativo:
+            # Janela zero sem nada em trânsito: nenhum ACK virá avisar que ela
+            # reabriu, então é preciso sondar a outra ponta
+            self._armar_persistencia()
+
+    def _transmitir_novo(self, payload):
         src_addr, src_port, dst_addr, dst_port = self.id_conexao
-        index = 0
-
-        if len(self.dados_enviados) == 0:
-            while index < len(dados):
-                payload = dados[index:index + MSS]
-                flags = FLAGS_ACK
-                self.dados_enviados[self.seq_client] = payload
-                segmento_novo = fix_checksum(make_header(dst_port, src_port, self.seq_client, self.ack_no, flags) + payload, src_addr, dst_addr)
-                self.segmentos[self.seq_client] = segmento_novo
-                index += MSS
-                self.seq_client += len(payload)
-
-        contador = 0
-        if not self.reenvio:
-            for seq in self.dados_enviados.keys():
-                if contador >= self.cwnd:
-                    break
-                self.servidor.rede.enviar(self.segmentos[seq], src_addr)
-                contador += len(self.segmentos[seq])
+        segmento = fix_checksum(montar_cabecalho(dst_port, src_port, self.seq_client, self.ack_no, FLAGS_ACK, self._janela_anunciada()) + payload, src_addr, dst_addr)
+        self.fila_envio.append(SegmentoEnviado(self.seq_client, payload, segmento, time()))
+        self.servidor.rede.enviar(segmento, src_addr)
+        self.seq_client += len(payload)
+        self._ack_enviado()
+
+    def _sondar_janela(self):
+        """
+        Timer de persistência: com a janela zero, envia como sonda um
+        segmento de 1 byte além dela ou, se já houver algo na fila de envio,
+        repete o primeiro segmento da fila. Cada ACK da sonda traz a janela
+        atual da outra ponta. Como a janela zero é controle de fluxo, e não
+        perda, as sondas não mexem no controle de congestionamento, no RTO
+        nem nos contadores de retransmissões, e a conexão só é abandonada se
+        MAXIMO_RETRANSMISSOES sondas seguidas ficarem sem resposta.
+        """
+        fila = self.fila_envio
+        if self.rwnd > 0:
+            # A janela reabriu: volta ao timer de retransmissão
+            if fila:
+                self._reiniciar_timer()
+            else:
+                self._enviar_janela()
+            return
+        if self.sondas_sem_resposta >= self.MAXIMO_RETRANSMISSOES:
+            # A outra ponta parou de responder
+            self._abortar()
+            return
+        if fila:
+            self._repetir_sonda()
+        elif self.bytes_pendentes:
+            self._transmitir_novo(self._retirar_do_buffer(1))
+            fila[0].sondas = 1
         else:
-            primeiro_item = list(self.dados_enviados.keys())[0]
-            self.servidor.rede.enviar(self.segmentos[primeiro_item], src_addr)
+            return
+        self.sondas += 1
+        self.sondas_sem_resposta += 1
+        self._armar_persistencia()
 
-        self.tempo_envio = time()
-        if self.timer is not None:
-            self.timer.cancel()
-        self.timer = asyncio.get_event_loop().call_later(self.intervalo_timeout, self._timer)
+    def _repetir_sonda(self):
+        """
+        Reenvia o primeiro segmento da fila como sonda de janela zero.
+        """
+        segmento = self.fila_envio[0]
+        segmento.sondas += 1
+        segmento.tempo_envio = time()
+        self.servidor.rede.enviar(segmento.segmento, self.id_conexao[0])
 
-    def fechar(self):
-        self.callback(self, b'')
+    def _enviar_fin_pendente(self):
+        """
+        Transmite o FIN se a aplicação já fechou a conexão e não há mais
+        dados pendentes. Ele fica na fila de envio como um segmento comum,
+        sendo retransmitido pelo timer até ser confirmado.
+        """
+        if not self.fin_pendente or self.bytes_pendentes or self.seq_fin is not None:
+            return
         src_addr, src_port, dst_addr, dst_port = self.id_conexao
-        self.open = False
-        flags = FLAGS_FIN
-        segmento_novo = fix_checksum(make_header(dst_port, src_port, self.seq_no, self.ack_no, flags), src_addr, dst_addr)
-        self.servidor.rede.enviar(segmento_novo, src_addr)
+        segmento = fix_checksum(montar_cabecalho(dst_port, src_port, self.seq_client, self.ack_no, FLAGS_FIN | FLAGS_ACK, self._janela_anunciada()), src_addr, dst_addr)
+        self.fila_envio.append(SegmentoEnviado(self.seq_client, b'', segmento, time(), fin=True))
+        self.servidor.rede.enviar(segmento, src_addr)
+        self.seq_fin = self.seq_client
+        self.seq_client += 1
+        self._ack_enviado()
+        if not self.timer.ativo:
+            self._reiniciar_timer()
+
+    def _fin_confirmado(self):
+        if self.estado == FIN_WAIT_1:
+            # Falta a outra ponta fechar; se ela não o fizer, desistimos
+            # depois de DURACAO_FIN_WAIT_2
+            self.estado = FIN_WAIT_2
+            self.timer_fechamento.armar(self.DURACAO_FIN_WAIT_2)
+        elif self.estado == CLOSING:
+            self.estado = TIME_WAIT
+            self._encerrar()
+        elif self.estado == LAST_ACK:
+            self.estado = CLOSED
+            self._encerrar()
+
+    def _expirar_fin_wait_2(self):
+        if self.estado == FIN_WAIT_2:
+            self.estado = CLOSED
+            self._encerrar()
+
+    def _abortar(self):
+        """
+        Descarta a conexão sem o fechamento normal, avisando a aplicação
+        (com dados vazios) se ela ainda não soube do fim da conexão, e
+        depois o monitor de aborto, se houver.
+        """
+        if self.estado in (CLOSED, TIME_WAIT):
+            return
+        self.estado = CLOSED
+        if self.callback is not None and not self.fin_entregue:
+            self.fin_entregue = True
+            self.callback(self, b'')
+        self._encerrar()
+        if self.callback_aborto is not None:
+            self.callback_aborto(self)
+
+    def _resetar(self):
+        """
+        Aborta a conexão avisando a outra ponta com um RST, em vez de deixá-la
+        retransmitir até desistir.
+        """
+        if self.estado in (CLOSED, TIME_WAIT):
+            return
+        self.servidor._enviar_rst(self.id_conexao, self.seq_client)
+        self._abortar()
+
+    def _encerrar(self):
+        """
+        Libera a conexão ao chegar em CLOSED ou TIME_WAIT: para os timers,
+        descarta os buffers e avisa o servidor, que a tira da tabela de
+        conexões (em TIME_WAIT, ele guarda só o necessário para confirmar
+        um FIN repetido).
+        """
+        self.timer.cancelar()
+        self.timer_persistencia.cancelar()
+        self.timer_ack.cancelar()
+        self.timer_fechamento.cancelar()
+        self.fila_envio.clear()
+        self.buffer_envio.clear()
+        self.bytes_pendentes = 0
+        self.buffer_recepcao.clear()
+        self.fora_de_ordem_inicios.clear()
+        self.fora_de_ordem_blocos.clear()
+        self.servidor._conexao_encerrada(self)
+
+    def fechar(self):
+        """
+        Fecha o sentido de envio da conexão: o FIN é enviado depois de todos
+        os dados pendentes, e continuamos recebendo até a outra ponta fechar
+        também. Chamadas repetidas são ignoradas.
+        """
+        if self.estado == ESTABLISHED:
+            self.estado = FIN_WAIT_1
+        elif self.estado == CLOSE_WAIT:
+            self.estado = LAST_ACK
+        else:
+            return
+        self.fin_pendente = True
+        self._enviar_janela()